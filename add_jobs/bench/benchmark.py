@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、启动stubServer子进程代替Docker、Jmx及ES，采集脚本的地址、状态文件均指向本地/临时目录
+2、在同一事件循环内多次执行各场景: getDockerInfo.main(poll/delta/stream)、getJmxInfo.run、两者同时执行、
+   entrypoint.build_job(python方式及shell方式)
+3、输出每个场景的耗时(平均/p95/最大)、每轮请求数、事件循环延迟及峰值RSS，可输出JSON便于比较
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.join(os.path.dirname(BENCH_DIR), "script")
+SCENARIOS = ["docker_poll", "docker_delta", "docker_stream", "jmx", "docker_and_jmx", "build_job_python",
+             "build_job_shell"]
+LOOP_LAG_INTERVAL = 0.01
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark collectors against local Docker/JMX/ES stubs")
+    parser.add_argument("--port", type=int, default=18375)
+    parser.add_argument("--containers", type=int, default=50)
+    parser.add_argument("--docker-latency", type=float, default=0.0)
+    parser.add_argument("--stats-latency", type=float, default=1.0)
+    parser.add_argument("--jmx-latency", type=float, default=0.0)
+    parser.add_argument("--es-latency", type=float, default=0.0)
+    parser.add_argument("--payload-kb", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1, help="runs per scenario excluded from the report")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+# 采集脚本在导入时读取环境变量，必须在导入前设置
+def setup_env(args, state_dir):
+    os.environ.update({
+        "DOCKER_HOST": "tcp://127.0.0.1:{}".format(args.port),
+        "ES_URL": "http://127.0.0.1:{}".format(args.port + 2),
+        "HOST_IP": "127.0.0.1",
+        "DOCKER_META_CACHE_FILE": os.path.join(state_dir, "docker_meta_cache.json"),
+        "DOCKER_STATS_STATE_FILE": os.path.join(state_dir, "docker_stats_state.json"),
+        "ES_INDEX_STATE_FILE": os.path.join(state_dir, "es_index_state.json"),
+        "SPOOL_DIR": os.path.join(state_dir, "es_spool"),
+        "METRICS_PORT": "0",
+        "POOL_STATS_INTERVAL": "0",
+    })
+    os.environ.setdefault("ES_SINK", "0")
+    # 每轮都重新发现容器，并发的场景仍共享同一次发现
+    os.environ.setdefault("DISCOVERY_TTL", "0")
+    sys.path.insert(0, SCRIPT_DIR)
+
+
+def start_stub(args):
+    command = [sys.executable, os.path.join(BENCH_DIR, "stubServer.py"), "--port", str(args.port),
+               "--containers", str(args.containers), "--docker-latency", str(args.docker_latency),
+               "--stats-latency", str(args.stats_latency), "--jmx-latency", str(args.jmx_latency),
+               "--es-latency", str(args.es_latency), "--payload-kb", str(args.payload_kb)]
+    proc = subprocess.Popen(command)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", args.port + 2), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("stub server did not start on port {}".format(args.port))
+
+
+def get_counts(port):
+    with urllib.request.urlopen("http://127.0.0.1:{}/__counts".format(port), timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+class LoopLagMonitor(object):
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self._interval = interval
+        self._task = None
+        self.samples = []
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start_time = loop.time()
+            await asyncio.sleep(self._interval)
+            self.samples.append(max(loop.time() - start_time - self._interval, 0.0))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def build_scenarios(session):
+    import getDockerInfo
+    import getJmxInfo
+    import entrypoint
+
+    python_job = {"job_name": "bench_python", "job_type": "python", "job_command": "getDockerInfo.main('sit')",
+                  "job_module": "getDockerInfo", "job_func": "main", "job_args": ["sit"],
+                  "job_kwargs": {"stats_mode": "delta"}, "job_timeout": 60, "job_concurrency": 1,
+                  "job_skip_if_running": False}
+    shell_job = dict(python_job, job_name="bench_shell", job_type="shell",
+                     job_command="cd {} && {} getDockerInfo.py sit".format(SCRIPT_DIR, sys.executable))
+    return {
+        "docker_poll": lambda: getDockerInfo.main("sit", session=session, stats_mode="poll"),
+        "docker_delta": lambda: getDockerInfo.main("sit", session=session, stats_mode="delta"),
+        "docker_stream": lambda: getDockerInfo.main("sit", session=session, stats_mode="stream"),
+        "jmx": lambda: getJmxInfo.run("sit", session=session),
+        "docker_and_jmx": lambda: asyncio.gather(getDockerInfo.main("sit", session=session, stats_mode="delta"),
+                                                 getJmxInfo.run("sit", session=session)),
+        "build_job_python": lambda: entrypoint.build_job(python_job),
+        "build_job_shell": lambda: entrypoint.build_job(shell_job),
+    }
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent), len(ordered) - 1)]
+
+
+async def run_scenario(name, func, args, monitor):
+    for _ in range(args.warmup):
+        await func()
+    walls = []
+    counts_before = get_counts(args.port)
+    monitor.start()
+    for _ in range(args.runs):
+        start_time = time.perf_counter()
+        await func()
+        walls.append(time.perf_counter() - start_time)
+    await monitor.stop()
+    counts_after = get_counts(args.port)
+    requests = {k: (v - counts_before.get(k, 0)) / args.runs for k, v in counts_after.items()
+                if v != counts_before.get(k, 0)}
+    return {
+        "scenario": name,
+        "runs": args.runs,
+        "wall_mean_ms": round(sum(walls) / len(walls) * 1000, 2),
+        "wall_p95_ms": round(percentile(walls, 0.95) * 1000, 2),
+        "wall_max_ms": round(max(walls) * 1000, 2),
+        "requests_per_run": requests,
+        "loop_lag_max_ms": round(max(monitor.samples or [0]) * 1000, 2),
+        "loop_lag_mean_ms": round(sum(monitor.samples) / max(len(monitor.samples), 1) * 1000, 3),
+        # Linux下ru_maxrss单位为KB，进程生命周期内的峰值
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+async def run_benchmark(args):
+    import httpPool
+    import esSink
+    import hostInfo
+    import getDockerInfo
+    scenarios = build_scenarios(httpPool.get_pool().session)
+    monitor = LoopLagMonitor()
+    results = []
+    try:
+        for name in args.scenarios.split(","):
+            results.append(await run_scenario(name, scenarios[name], args, monitor))
+    finally:
+        await getDockerInfo.close()
+        await esSink.get_sink(lambda: httpPool.get_pool().session).close()
+        await httpPool.get_pool().close()
+        await hostInfo.close()
+        # 结束dockerMeta事件订阅、stats长连接等后台任务
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+    return results
+
+
+def format_table(results):
+    lines = ["{:<18} {:>5} {:>10} {:>10} {:>10} {:>10} {:>9}  {}".format(
+        "scenario", "runs", "mean_ms", "p95_ms", "max_ms", "lag_max", "rss_mb", "requests/run")]
+    for x in results:
+        requests = " ".join("{}={:g}".format(k, v) for k, v in sorted(x['requests_per_run'].items()))
+        lines.append("{:<18} {:>5} {:>10} {:>10} {:>10} {:>10} {:>9}  {}".format(
+            x['scenario'], x['runs'], x['wall_mean_ms'], x['wall_p95_ms'], x['wall_max_ms'], x['loop_lag_max_ms'],
+            x['peak_rss_mb'], requests))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    arguments = parse_args(sys.argv[1:])
+    stub = start_stub(arguments)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            setup_env(arguments, tmp_dir)
+            loop = asyncio.get_event_loop()
+            bench_results = loop.run_until_complete(run_benchmark(arguments))
+            print(json.dumps(bench_results, indent=2) if arguments.json else format_table(bench_results))
+    finally:
+        stub.terminate()
+        stub.wait()
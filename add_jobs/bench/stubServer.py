@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、本地aiohttp桩服务，模拟Docker API(/containers/json、inspect、stats、/events)、Jmx(/admin/metrics)及ES(_bulk、索引、模板)
+   Docker、Jmx、ES分别监听port、port+1、port+2，各自占用独立的连接池配额
+2、容器数量、各接口延迟及stats/Jmx响应体大小可配置
+3、按接口类型统计请求数，GET /__counts返回当前计数，供benchmark计算每轮请求数
+"""
+
+import os
+import sys
+import json
+import time
+import gzip
+import asyncio
+import argparse
+from aiohttp import web
+
+
+class StubServer(object):
+
+    def __init__(self, port, containers=50, docker_latency=0.0, stats_latency=1.0, jmx_latency=0.0,
+                 es_latency=0.0, payload_kb=0):
+        self._port = port
+        self._containers = containers
+        self._docker_latency = docker_latency
+        self._stats_latency = stats_latency
+        self._jmx_latency = jmx_latency
+        self._es_latency = es_latency
+        self._padding = "x" * (payload_kb * 1024)
+        self.counts = {}
+
+    def _count(self, key, amount=1):
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    def _ids(self):
+        return ["{:064x}".format(i + 1) for i in range(self._containers)]
+
+    def _stats(self, precpu=True):
+        now = time.time()
+        cpu_stats = {"cpu_usage": {"total_usage": int(now * 1e8)}, "system_cpu_usage": int(now * 4e9),
+                     "online_cpus": 4}
+        pre_cpu_stats = {"cpu_usage": {"total_usage": int((now - 1) * 1e8)},
+                         "system_cpu_usage": int((now - 1) * 4e9)} if precpu else {"cpu_usage": {"total_usage": 0}}
+        return {"read": now, "cpu_stats": cpu_stats, "precpu_stats": pre_cpu_stats,
+                "memory_stats": {"usage": 256 * 1024 * 1024, "limit": 1024 * 1024 * 1024},
+                "networks": {"eth0": {"rx_bytes": 1, "tx_bytes": 1, "padding": self._padding}}}
+
+    async def containers(self, request):
+        self._count("docker_list")
+        await asyncio.sleep(self._docker_latency)
+        return web.json_response([{"Id": x, "Names": ["/app-{}".format(x[-6:])]} for x in self._ids()])
+
+    async def inspect(self, request):
+        self._count("docker_inspect")
+        await asyncio.sleep(self._docker_latency)
+        con_id = request.match_info['id']
+        env = ["MARATHON_APP_ID=/bench/app-{}".format(con_id[-6:]), "LIBPROCESS_IP=127.0.0.1",
+               "PORT0={}".format(self._port + 1), "JAVA_OPTS=-Xmx512m", "MARATHON_APP_RESOURCE_CPUS=1",
+               "MARATHON_APP_RESOURCE_MEM=1024"]
+        return web.json_response({"Id": con_id, "Config": {"Env": env},
+                                  "HostConfig": {"CpuShares": 1024, "Memory": 0}})
+
+    # stream=0时Docker需等待约1秒采集precpu_stats，one-shot=true时立即返回
+    async def stats(self, request):
+        if request.query.get("stream", "1") in ("1", "true"):
+            self._count("docker_stats_stream")
+            resp = web.StreamResponse()
+            await resp.prepare(request)
+            try:
+                while True:
+                    await resp.write((json.dumps(self._stats()) + "\n").encode())
+                    await asyncio.sleep(1)
+            except ConnectionResetError:
+                return resp
+        if request.query.get("one-shot") == "true":
+            self._count("docker_stats_oneshot")
+            await asyncio.sleep(self._docker_latency)
+            return web.json_response(self._stats(precpu=False))
+        self._count("docker_stats")
+        await asyncio.sleep(self._stats_latency)
+        return web.json_response(self._stats())
+
+    async def events(self, request):
+        self._count("docker_events")
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        while True:
+            await asyncio.sleep(3600)
+
+    async def jmx(self, request):
+        self._count("jmx")
+        await asyncio.sleep(self._jmx_latency)
+        body = {"mem": 1048576, "processors": 4, "padding": self._padding, "heap": 524288, "heap.used": 262144,
+                "nonheap": 131072, "threads": 64, "classes": 12000}
+        return web.json_response(body)
+
+    async def es(self, request):
+        body = await request.read()
+        await asyncio.sleep(self._es_latency)
+        if request.path.endswith("/_bulk"):
+            if request.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            docs = body.count(b"\n") // 2
+            self._count("es_bulk")
+            self._count("es_bulk_docs", docs)
+            return web.json_response({"took": 1, "errors": False, "items": [{"index": {"status": 201}}] * docs})
+        self._count("es_{}".format(request.method.lower()))
+        if request.method == "HEAD":
+            return web.Response(status=200)
+        return web.json_response({"acknowledged": True})
+
+    async def get_counts(self, request):
+        return web.json_response(self.counts)
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/containers/json", self.containers)
+        app.router.add_get("/containers/{id}/json", self.inspect)
+        app.router.add_get("/containers/{id}/stats", self.stats)
+        app.router.add_get("/events", self.events)
+        app.router.add_get("/admin/metrics", self.jmx)
+        app.router.add_get("/__counts", self.get_counts)
+        app.router.add_route("*", "/{tail:.*}", self.es)
+        return app
+
+    async def start(self, host="127.0.0.1"):
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        for port in (self._port, self._port + 1, self._port + 2):
+            await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Docker/JMX/ES stub server for benchmarks")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BENCH_PORT", 18375)))
+    parser.add_argument("--containers", type=int, default=50)
+    parser.add_argument("--docker-latency", type=float, default=0.0, help="seconds per Docker API call")
+    parser.add_argument("--stats-latency", type=float, default=1.0, help="seconds per stats?stream=0 call")
+    parser.add_argument("--jmx-latency", type=float, default=0.0)
+    parser.add_argument("--es-latency", type=float, default=0.0)
+    parser.add_argument("--payload-kb", type=int, default=0, help="padding added to stats and JMX bodies")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    server = StubServer(port=args.port, containers=args.containers, docker_latency=args.docker_latency,
+                        stats_latency=args.stats_latency, jmx_latency=args.jmx_latency, es_latency=args.es_latency,
+                        payload_kb=args.payload_kb)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、直接读取容器的cgroup文件获取CPU及内存计数，不经过Docker stats API
+2、支持cgroup v1(cpuacct.usage、memory.usage_in_bytes、memory.limit_in_bytes)
+   及cgroup v2(cpu.stat中的usage_usec、memory.current、memory.max)，cgroupfs及systemd两种驱动的目录布局
+3、返回结构与Docker stats一致(cpu_stats、memory_stats)，主机CPU时间取自/proc/stat，与Docker的system_cpu_usage口径相同，
+   /proc/stat及/proc/meminfo由read_host()每个周期读取一次，传给各容器的read_stats()
+4、在容器内运行时需把宿主机的/sys/fs/cgroup和/proc挂载进来，并通过CGROUP_ROOT、PROC_ROOT指定
+"""
+
+import os
+
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", "/sys/fs/cgroup")
+PROC_ROOT = os.environ.get("PROC_ROOT", "/proc")
+NANOSECONDS = 1e9
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def is_cgroup_v2(root=CGROUP_ROOT):
+    return os.path.exists(os.path.join(root, "cgroup.controllers"))
+
+
+# 依次尝试cgroupfs驱动(docker/{id})及systemd驱动(system.slice/docker-{id}.scope)的目录
+def find_cgroup(con_id, subsystem="", root=CGROUP_ROOT):
+    for relative in ("docker/{}".format(con_id), "system.slice/docker-{}.scope".format(con_id)):
+        path = os.path.join(root, subsystem, relative)
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+# 与Docker相同: /proc/stat中cpu行前7项(user、nice、system、idle、iowait、irq、softirq)之和，换算为纳秒
+def read_system_cpu(proc_root=PROC_ROOT):
+    system_cpu_usage = None
+    online_cpus = 0
+    with open(os.path.join(proc_root, "stat")) as f:
+        for line in f:
+            if line.startswith("cpu "):
+                ticks = sum(int(x) for x in line.split()[1:8])
+                system_cpu_usage = int(ticks * NANOSECONDS / os.sysconf("SC_CLK_TCK"))
+            elif line.startswith("cpu"):
+                online_cpus += 1
+            else:
+                break
+    return system_cpu_usage, online_cpus or os.cpu_count()
+
+
+def read_host_memory(proc_root=PROC_ROOT):
+    with open(os.path.join(proc_root, "meminfo")) as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def read_v1(con_id, root=CGROUP_ROOT):
+    cpu_path = find_cgroup(con_id, "cpuacct", root) or find_cgroup(con_id, "cpu,cpuacct", root)
+    mem_path = find_cgroup(con_id, "memory", root)
+    if cpu_path is None or mem_path is None:
+        return None
+    total_usage = read_file(os.path.join(cpu_path, "cpuacct.usage"))
+    mem_usage = read_file(os.path.join(mem_path, "memory.usage_in_bytes"))
+    mem_limit = read_file(os.path.join(mem_path, "memory.limit_in_bytes"))
+    if total_usage is None or mem_usage is None:
+        return None
+    return int(total_usage), int(mem_usage), int(mem_limit) if mem_limit else None
+
+
+def read_v2(con_id, root=CGROUP_ROOT):
+    path = find_cgroup(con_id, "", root)
+    if path is None:
+        return None
+    cpu_stat = read_file(os.path.join(path, "cpu.stat"))
+    mem_usage = read_file(os.path.join(path, "memory.current"))
+    mem_limit = read_file(os.path.join(path, "memory.max"))
+    if cpu_stat is None or mem_usage is None:
+        return None
+    usage_usec = dict(x.split() for x in cpu_stat.splitlines())['usage_usec']
+    return int(usage_usec) * 1000, int(mem_usage), int(mem_limit) if mem_limit and mem_limit != "max" else None
+
+
+# 主机CPU时间及内存总量，每个采集周期读取一次，所有容器共用
+def read_host(proc_root=PROC_ROOT):
+    system_cpu_usage, online_cpus = read_system_cpu(proc_root)
+    return {"system_cpu_usage": system_cpu_usage, "online_cpus": online_cpus, "memory": read_host_memory(proc_root)}
+
+
+def read_stats(con_id, host=None, root=CGROUP_ROOT, proc_root=PROC_ROOT):
+    counters = read_v2(con_id, root) if is_cgroup_v2(root) else read_v1(con_id, root)
+    if counters is None:
+        return None
+    total_usage, mem_usage, mem_limit = counters
+    if host is None:
+        host = read_host(proc_root)
+    system_cpu_usage, online_cpus, host_memory = host['system_cpu_usage'], host['online_cpus'], host['memory']
+    # 未限制内存时与Docker一致，以宿主机内存总量作为上限
+    if mem_limit is None or (host_memory is not None and mem_limit > host_memory):
+        mem_limit = host_memory
+    return {
+        "cpu_stats": {"cpu_usage": {"total_usage": total_usage},
+                      "system_cpu_usage": system_cpu_usage,
+                      "online_cpus": online_cpus},
+        "memory_stats": {"usage": mem_usage, "limit": mem_limit or 0}
+    }
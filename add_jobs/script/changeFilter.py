@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、变化检测: 每个容器的新文档与上一次推送的文档比较，未变化的文档不再编码推送
+2、deadband按字段配置阈值，数字为绝对值，"5%"形式为相对上次推送值的比例；未配置阈值的字段需完全相同，
+   @timestamp及由其他字段计算得出的字段(如per_cpu_usage)不参与比较，汇总文档的_min/_max字段沿用原字段的阈值
+3、距上一次推送超过heartbeat_seconds(默认CHANGE_HEARTBEAT_SECONDS)时无论是否变化都推送一次心跳，看板不会断线
+4、推送成功(或已交给esSink排队)后才调用commit()记录为上一次推送的文档，推送失败时下次不会被误丢弃
+5、上一次推送的文档保存在内存及CHANGE_FILTER_STATE_FILE中(由stateFile读写)，命令行方式逐次运行时同样生效
+6、命令行方式运行时通过环境变量CHANGE_DEADBAND(JSON)开启
+"""
+
+import os
+import re
+import json
+import time
+import stateFile
+
+CHANGE_FILTER_STATE_FILE = os.environ.get("CHANGE_FILTER_STATE_FILE", "/tmp/change_filter_state.json")
+CHANGE_HEARTBEAT_SECONDS = float(os.environ.get("CHANGE_HEARTBEAT_SECONDS", 300))
+# 例如{"cpu_usage": 1, "mem_usage": "5%"}，{}表示所有字段完全相同时才丢弃，未设置时不过滤
+CHANGE_DEADBAND = json.loads(os.environ["CHANGE_DEADBAND"]) if os.environ.get("CHANGE_DEADBAND") else None
+SUFFIX_REGEX = re.compile(r"_(min|max)$")
+
+
+# 采集脚本的推送结果[文档数, [Http状态码, 响应]]，交给esSink排队的文档写入失败时由esSpool落盘回放，视为成功
+def push_succeeded(result):
+    return result is not None and result[1] is not None and result[1][0] // 100 == 2 and not result[1][1]['errors']
+
+
+def parse_threshold(threshold):
+    if isinstance(threshold, str) and threshold.endswith("%"):
+        return 0.0, float(threshold[:-1]) / 100
+    return float(threshold), 0.0
+
+
+class ChangeFilter(object):
+
+    def __init__(self, state_file=CHANGE_FILTER_STATE_FILE):
+        self._state_file = state_file
+        # 索引前缀 -> 容器ID -> {"shipped": 推送时的@timestamp, "doc": 推送的文档}
+        self._shipped = {}
+        self._stats = {"shipped": 0, "suppressed": 0, "heartbeat": 0}
+        self.load()
+
+    def load(self):
+        self._shipped = stateFile.load(self._state_file, {})
+
+    def save(self):
+        stateFile.save(self._state_file, self._shipped)
+
+    @staticmethod
+    def changed(doc, last_doc, deadband):
+        if doc.keys() != last_doc.keys():
+            return True
+        for field, value in doc.items():
+            last_value = last_doc[field]
+            # 汇总文档的{字段}_min、{字段}_max沿用该字段的阈值
+            band = deadband.get(field) or deadband.get(SUFFIX_REGEX.sub("", field))
+            if band is not None and isinstance(value, (int, float)) and isinstance(last_value, (int, float)):
+                if abs(value - last_value) > max(band[0], abs(last_value) * band[1]):
+                    return True
+            elif value != last_value:
+                return True
+        return False
+
+    # 返回需要推送的文档，未变化且未到心跳时间的文档被丢弃；ignore中的字段(由其他字段计算得出)不参与比较
+    def filter(self, source, docs, deadband, heartbeat_seconds=CHANGE_HEARTBEAT_SECONDS, ignore=()):
+        deadband = {k: parse_threshold(v) for k, v in deadband.items()}
+        shipped = self._shipped.setdefault(source, {})
+        for con_id in [x for x in shipped.keys() if x not in docs]:
+            del shipped[con_id]
+        result = {}
+        for con_id, doc in docs.items():
+            last = shipped.get(con_id)
+            if last is not None and not self.changed(self.values(doc, ignore), last['doc'], deadband):
+                if doc.get("@timestamp", time.time() * 1000) - last['shipped'] < heartbeat_seconds * 1000:
+                    self._stats['suppressed'] += 1
+                    continue
+                self._stats['heartbeat'] += 1
+            result[con_id] = doc
+        return result
+
+    # 推送成功后记录为上一次推送的文档，推送失败的文档下次仍与更早推送的文档比较
+    def commit(self, source, docs, ignore=()):
+        shipped = self._shipped.setdefault(source, {})
+        for con_id, doc in docs.items():
+            shipped[con_id] = {"shipped": doc.get("@timestamp", time.time() * 1000), "doc": self.values(doc, ignore)}
+            self._stats['shipped'] += 1
+        self.save()
+
+    @staticmethod
+    def values(doc, ignore):
+        return {k: v for k, v in doc.items() if k != "@timestamp" and k not in ignore}
+
+    def stats(self):
+        return dict(self._stats)
+
+
+_filter = None
+
+
+def get_filter():
+    global _filter
+    if _filter is None:
+        _filter = ChangeFilter()
+    return _filter
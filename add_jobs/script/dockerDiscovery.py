@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、统一的容器发现: 每个周期只调用一次/containers/json，并通过dockerMeta缓存inspect全部容器
+2、getDockerInfo与getJmxInfo共用同一份快照，DISCOVERY_TTL秒内的后续调用直接复用，发现进行中时等待同一次结果，
+   只有两个Job在同一进程内、触发时间相差不超过DISCOVERY_TTL时才会共用(间隔相同且不设phase，或phase_group相同)
+3、快照时间只用于判断是否过期，文档的@timestamp仍为各自的采样时间
+4、jvm_containers()按JAVA_OPTS、MARATHON_APP_ID筛选需要采集Jmx的容器
+"""
+
+import os
+import time
+import asyncio
+import dockerMeta
+import metrics
+
+DISCOVERY_TTL = float(os.environ.get("DISCOVERY_TTL", 5))
+JVM_ENV_KEYS = {"JAVA_OPTS", "MARATHON_APP_ID"}
+
+
+def parse_env(env_list):
+    result = {}
+    for item in env_list:
+        key, value = item.split("=", 1)
+        result.update({key: value})
+    return result
+
+
+class Snapshot(object):
+
+    def __init__(self, timestamp, containers):
+        # 毫秒，发现完成的时间
+        self.timestamp = timestamp
+        # 容器ID -> dockerMeta中的inspect字段
+        self.containers = containers
+        self._envs = {}
+
+    def env(self, con_id):
+        if con_id not in self._envs:
+            self._envs[con_id] = parse_env(self.containers[con_id]['Config']['Env'])
+        return self._envs[con_id]
+
+    def jvm_containers(self):
+        return {con_id: self.env(con_id) for con_id in self.containers.keys()
+                if JVM_ENV_KEYS.issubset(self.env(con_id).keys())}
+
+
+class DockerDiscovery(object):
+
+    def __init__(self, ttl=DISCOVERY_TTL):
+        self._ttl = ttl
+        self._snapshots = {}
+        self._pending = {}
+        self._stats = {"discover": 0, "shared": 0}
+
+    async def _list(self, docker_prefix, session):
+        url = "{prefix}/containers/json".format(prefix=docker_prefix)
+        with metrics.stage("dockerDiscovery", "docker_list"):
+            async with session.get(url, timeout=10) as resp:
+                if resp.status // 100 != 2:
+                    return None
+                return [x['Id'] for x in await resp.json()]
+
+    async def _inspect(self, docker_prefix, con_id, session, containers):
+        try:
+            con_info = await dockerMeta.get_cache().inspect(docker_prefix, con_id, session)
+            if con_info[0] // 100 == 2:
+                containers[con_id] = con_info[1]
+        except Exception as e:
+            print("{} dockerDiscovery Func inspect() {} Error Message: {}".format(time.time(), con_id[:12], e))
+
+    async def _discover(self, docker_prefix, session):
+        self._stats['discover'] += 1
+        timestamp = time.time() * 1000
+        cons_id = await self._list(docker_prefix, session)
+        if cons_id is None:
+            return Snapshot(timestamp, {})
+        meta_cache = dockerMeta.get_cache()
+        meta_cache.prune(cons_id)
+        containers = {}
+        if cons_id:
+            with metrics.stage("dockerDiscovery", "docker_inspect"):
+                await asyncio.wait([asyncio.ensure_future(self._inspect(docker_prefix, x, session, containers))
+                                    for x in cons_id])
+        meta_cache.save()
+        snapshot = Snapshot(timestamp, containers)
+        self._snapshots[docker_prefix] = snapshot
+        return snapshot
+
+    # TTL内复用上一次快照；并发调用共享同一次发现，调用方超时取消时不影响其他等待者
+    async def snapshot(self, docker_prefix, session):
+        snapshot = self._snapshots.get(docker_prefix)
+        if snapshot is not None and time.time() * 1000 - snapshot.timestamp < self._ttl * 1000:
+            self._stats['shared'] += 1
+            return snapshot
+        task = self._pending.get(docker_prefix)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._discover(docker_prefix, session))
+            self._pending[docker_prefix] = task
+        else:
+            self._stats['shared'] += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return dict(self._stats)
+
+
+_discovery = None
+
+
+def get_discovery():
+    global _discovery
+    if _discovery is None:
+        _discovery = DockerDiscovery()
+    return _discovery
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、容器元数据缓存，按容器ID保存inspect结果中采集需要的字段(Config.Env、HostConfig.CpuShares/Memory)
+2、getDockerInfo和getJmxInfo共用，容器存活期间不再重复调用/containers/{id}/json
+3、进程内运行时订阅Docker /events，容器start时预热缓存，die/destroy时失效
+4、缓存持久化到本地文件(由stateFile读写)，cron容器重启后直接使用
+"""
+
+import os
+import json
+import time
+import asyncio
+import stateFile
+
+DOCKER_META_CACHE_FILE = os.environ.get("DOCKER_META_CACHE_FILE", "/tmp/docker_meta_cache.json")
+DOCKER_EVENTS_FILTERS = json.dumps({"type": ["container"], "event": ["start", "die", "destroy"]})
+DOCKER_EVENTS_RETRY = 5
+
+
+class ContainerMetaCache(object):
+
+    def __init__(self, cache_file=DOCKER_META_CACHE_FILE):
+        self._cache_file = cache_file
+        self._meta = {}
+        self._dirty = False
+        self._watchers = {}
+        self._stats = {"hit": 0, "miss": 0, "invalidate": 0}
+        self.load()
+
+    def load(self):
+        self._meta = stateFile.load(self._cache_file, {})
+
+    def save(self):
+        if self._dirty and stateFile.save(self._cache_file, self._meta):
+            self._dirty = False
+
+    @staticmethod
+    def _trim(con_info):
+        return {
+            "Config": {"Env": con_info['Config']['Env']},
+            "HostConfig": {"CpuShares": con_info['HostConfig']['CpuShares'],
+                           "Memory": con_info['HostConfig']['Memory']}
+        }
+
+    # 返回值格式与采集脚本的http客户端一致: [status, data]
+    async def inspect(self, docker_prefix, con_id, session):
+        if con_id in self._meta:
+            self._stats['hit'] += 1
+            return [200, self._meta[con_id]]
+        self._stats['miss'] += 1
+        url = "{prefix}/containers/{con_id}/json".format(prefix=docker_prefix, con_id=con_id)
+        async with session.get(url, timeout=10) as resp:
+            if resp.status // 100 != 2:
+                return [resp.status, None]
+            self._meta[con_id] = self._trim(await resp.json())
+            self._dirty = True
+            return [resp.status, self._meta[con_id]]
+
+    def invalidate(self, con_id):
+        if self._meta.pop(con_id, None) is not None:
+            self._stats['invalidate'] += 1
+            self._dirty = True
+
+    # 清理已不在容器列表中的缓存(命令行方式运行时没有事件订阅，依靠列表清理)
+    def prune(self, live_ids):
+        for con_id in [x for x in self._meta.keys() if x not in live_ids]:
+            self.invalidate(con_id)
+
+    def watch(self, docker_prefix, session):
+        task = self._watchers.get(docker_prefix)
+        if task is None or task.done():
+            self._watchers[docker_prefix] = asyncio.ensure_future(self.watch_events(docker_prefix, session))
+
+    async def watch_events(self, docker_prefix, session):
+        import aiohttp
+        url = "{prefix}/events".format(prefix=docker_prefix)
+        while not session.closed:
+            try:
+                async with session.get(url, params={"filters": DOCKER_EVENTS_FILTERS},
+                                       timeout=aiohttp.ClientTimeout(total=None)) as resp:
+                    async for line in resp.content:
+                        if not line.strip():
+                            continue
+                        event = json.loads(line)
+                        con_id = event.get('id') or event.get('Actor', {}).get('ID')
+                        if event.get('status') == "start" or event.get('Action') == "start":
+                            self.invalidate(con_id)
+                            await self.inspect(docker_prefix, con_id, session)
+                        else:
+                            self.invalidate(con_id)
+                        self.save()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("{} dockerMeta Func watch_events() Error Message: {}".format(time.time(), e))
+            await asyncio.sleep(DOCKER_EVENTS_RETRY)
+
+    def stats(self):
+        result = dict(self._stats)
+        result['size'] = len(self._meta)
+        return result
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ContainerMetaCache()
+    return _cache
@@ -5,17 +5,103 @@
 1、获取环境变量中的Job列表及任务执行周期
 2、循环加入调度器
 3、启动调度器
+4、Job以asyncio子进程方式执行，全局并发数由JOB_CONCURRENCY限制，单Job并发数由job_concurrency限制
+5、job_type为python的Job在本进程内导入模块一次，直接在调度器事件循环上await其main/run协程
+6、python类型的Job共享同一个aiohttp连接池，定期打印连接复用统计
+7、python类型的Job把ES文档提交到进程内的esSink，跨Job合并为更大的_bulk请求
+8、后台回放esSpool中写入ES失败的文档(包括命令行方式运行的采集脚本落盘的文档)
+9、在METRICS_PORT上以Prometheus文本格式输出Job耗时/排队/错过执行、事件循环延迟、子进程数及采集各阶段耗时
+10、单Job可配置job_max_instances、job_coalesce、job_skip_if_running，被丢弃或合并的执行会打印并计入指标
+11、job_trigger支持crontab表达式、按主机名哈希的相位偏移及随机抖动，由jobTrigger生成触发器
+12、adaptive触发的Job每次执行后把耗时及是否失败(退出码非0或本次推送失败)反馈给触发器调整间隔，
+    python类型的Job按返回值判断推送结果，shell类型的Job按输出中的"Push failed"判断
+13、Job输出按行读取到有界的环形缓冲，stderr一并捕获，执行结果可按JSON行输出(带run_id)，见jobOutput
+14、aiohttp等较重的依赖在首次使用时才导入，启动后在后台测量并打印每个Job模块的导入耗时，见importCost
+15、除环境变量JOB_n外还可从JOB_FILE读取Job，文件变化时与调度器中的Job逐个比较，就地新增、删除、重新调度或修改，
+    Job ID即job_name，未变化的Job及正在执行的实例不受影响，见jobReload
 """
 
 
 import os
 import re
+import ast
 import json
 import asyncio
+import importlib
+import importlib.util
+import inspect
+import signal
 import time
+import httpPool
+import changeFilter
+import dockerDiscovery
+import esBulk
+import esSink
+import esSpool
+import hostInfo
+import importCost
+import jobOutput
+import jobReload
+import jobTrigger
+import metrics
+import sampleStore
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
+# 采集脚本推送失败时输出的日志片段，见各脚本的format_result
+PUSH_FAILED_LINE = " Push failed."
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 8))
+POOL_STATS_INTERVAL = int(os.environ.get("POOL_STATS_INTERVAL", 300))
+ES_SINK = os.environ.get("ES_SINK", "1") == "1"
+job_semaphores = {}
+job_modules = {}
+job_running = {}
+job_last_run_times = {}
+# job_name -> 当前已加入调度器的Job定义
+job_definitions = {}
+# entrypoint内部Job的ID前缀，不与job_name冲突
+INTERNAL_JOB_PREFIX = "__entrypoint__."
+
+JOB_RUN_SECONDS = metrics.REGISTRY.histogram("job_run_seconds", "Job run duration in seconds.", ("job",))
+JOB_QUEUE_SECONDS = metrics.REGISTRY.histogram("job_queue_seconds", "Time a job waited for a concurrency slot.",
+                                               ("job",))
+JOB_MISFIRES = metrics.REGISTRY.counter("job_misfires_total", "Job runs missed by the scheduler.", ("job",))
+JOB_FAILURES = metrics.REGISTRY.counter("job_failures_total", "Job runs that failed or timed out.", ("job",))
+JOB_DROPPED = metrics.REGISTRY.counter("job_dropped_total", "Job runs dropped because earlier runs were still active.",
+                                       ("job", "reason"))
+JOB_COALESCED = metrics.REGISTRY.counter("job_coalesced_total", "Overdue job runs merged into a single run.", ("job",))
+JOB_INTERVAL_SECONDS = metrics.REGISTRY.gauge("job_interval_seconds", "Current interval of adaptive jobs.", ("job",))
+RUNNING_SUBPROCESSES = metrics.REGISTRY.gauge("running_subprocesses", "Shell job subprocesses currently running.")
+JOB_IMPORT_SECONDS = metrics.REGISTRY.gauge("job_import_seconds", "Measured import time of a job's module.", ("job",))
+
+
+def parse_job(job_json):
+    job_type = job_json.get('job_type', "shell")
+    job_args = job_json.get('job_args', [])
+    if job_type == "python":
+        job_command = job_json.get('job_command', None) or "{}.{}({})".format(
+            job_json['job_module'], job_func_name(job_json['job_module'], job_json.get('job_func', None)),
+            ", ".join([repr(x) for x in job_args] +
+                      ["{}={!r}".format(k, v) for k, v in job_json.get('job_kwargs', {}).items()]))
+    else:
+        job_command = job_json['job_command']
+    return {
+        "job_name": job_json['job_name'],
+        "job_type": job_type,
+        "job_command": job_command,
+        "job_module": job_json.get('job_module', None),
+        "job_func": job_json.get('job_func', None),
+        "job_args": job_args,
+        "job_kwargs": job_json.get('job_kwargs', {}),
+        "job_timeout": job_json.get('job_timeout', None),
+        "job_trigger": job_json['job_trigger'],
+        "job_concurrency": int(job_json.get('job_concurrency', 1)),
+        "job_max_instances": int(job_json.get('job_max_instances', job_json.get('job_concurrency', 1))),
+        "job_coalesce": bool(job_json.get('job_coalesce', True)),
+        "job_skip_if_running": bool(job_json.get('job_skip_if_running', False))
+    }
+
 
 def get_jobs():
     job_list = []
@@ -23,58 +109,337 @@ def get_jobs():
     job_regex = re.compile(r'\bJOB_[0-9]*\b')
     for el in env_list.keys():
         if job_regex.match(el) is not None:
-            job_json = json.loads(env_list[el])
-            job_list.append({
-                "job_name": job_json['job_name'],
-                "job_command": job_json['job_command'],
-                "job_trigger": job_json['job_trigger']
-            })
+            job_list.append(parse_job(json.loads(env_list[el])))
+    # Job ID即job_name，同名的JOB_n无法同时调度，启动时直接报错
+    names = [x['job_name'] for x in job_list]
+    duplicates = sorted(set(x for x in names if names.count(x) > 1))
+    if duplicates:
+        raise ValueError("Duplicate job_name in JOB_n: {}".format(", ".join(duplicates)))
     return job_list
 
 
-def build_job(job_name, job_command):
-    job_start_time_ts = time.time()
-    job_start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job_start_time_ts))
-    run_command = os.popen(job_command).readlines()
-    if run_command is not None:
-        messages = [m.strip("\n") for m in run_command]
-    else:
-        messages = None
-    cost_time = format((time.time() - job_start_time_ts), '0.3f')
-    print("[{time}] [{name}: {command}] {messages} CostTime: {cost}s".format(time=job_start_time,
-                                                                            name=job_name,
-                                                                            command=job_command,
-                                                                            messages=messages,
-                                                                            cost=cost_time))
+# 与调度器中已有的Job逐个比较: 新增、删除、重新调度或修改参数，返回新增的Job
+def sync_jobs(jobs):
+    desired = {x['job_name']: x for x in jobs}
+    added = []
+    for name in [x for x in job_definitions.keys() if x not in desired]:
+        # 已在执行的实例继续运行至结束
+        scheduler.remove_job(name)
+        del job_definitions[name]
+        jobTrigger.adaptive_triggers.pop(name, None)
+        job_last_run_times.pop(name, None)
+        print("{} Job removed: {}".format(time.time(), name))
+    for name, job in desired.items():
+        old_job = job_definitions.get(name)
+        if old_job == job:
+            continue
+        try:
+            trigger = None
+            if old_job is None or old_job['job_trigger'] != job['job_trigger']:
+                trigger = jobTrigger.build_trigger(name, job['job_trigger'])
+                if not isinstance(trigger, jobTrigger.AdaptiveTrigger):
+                    jobTrigger.adaptive_triggers.pop(name, None)
+            if old_job is None:
+                scheduler.add_job(func=build_job, args=[job], id=name, name=name,
+                                  misfire_grace_time=3600,
+                                  max_instances=job['job_max_instances'],
+                                  coalesce=job['job_coalesce'],
+                                  trigger=trigger)
+                added.append(job)
+                if scheduler.running:
+                    print("{} Job added: {}, job_trigger:{}".format(time.time(), name, trigger))
+            else:
+                if any(old_job[k] != job[k] for k in job.keys() if k != 'job_trigger'):
+                    # 之后的执行使用新参数，正在执行的实例仍持有旧的Job定义及信号量
+                    scheduler.modify_job(name, args=[job], max_instances=job['job_max_instances'],
+                                         coalesce=job['job_coalesce'])
+                    if old_job['job_concurrency'] != job['job_concurrency']:
+                        job_semaphores.pop(name, None)
+                if trigger is not None:
+                    scheduler.reschedule_job(name, trigger=trigger)
+                    # 新触发器的时间点与上一次执行无关，不统计为合并
+                    job_last_run_times.pop(name, None)
+                print("{} Job updated: {}, job_trigger:{}".format(time.time(), name, scheduler.get_job(name).trigger))
+            job_definitions[name] = job
+        except Exception as e:
+            print("{} entrypoint Func sync_jobs() {} Error Message: {}".format(time.time(), name, e))
+    return added
+
+
+# 环境变量中的Job与JOB_FILE中的Job合并，同名时以文件为准
+def reload_jobs(file_jobs):
+    jobs = {x['job_name']: x for x in get_jobs()}
+    file_names = set()
+    for job_json in file_jobs:
+        name = job_json.get('job_name') if isinstance(job_json, dict) else None
+        if name is not None and name in file_names:
+            print("{} entrypoint Func reload_jobs() Duplicate job_name in JOB_FILE, ignored: {}".format(time.time(),
+                                                                                                         name))
+            continue
+        file_names.add(name)
+        try:
+            jobs[name] = parse_job(job_json)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print("{} entrypoint Func reload_jobs() {} Error Message: {}: {}".format(time.time(), name,
+                                                                                     type(e).__name__, e))
+            # 定义有误时保留正在调度的旧定义
+            if name in job_definitions:
+                jobs[name] = job_definitions[name]
+    added = sync_jobs(list(jobs.values()))
+    if added and scheduler.running and importCost.IMPORT_COST_REPORT:
+        asyncio.ensure_future(report_import_cost(added))
+
+
+def get_semaphore(name, limit):
+    if name not in job_semaphores:
+        job_semaphores[name] = asyncio.Semaphore(limit)
+    return job_semaphores[name]
+
+
+# 未指定job_func时优先main，没有main时用run；模块尚未导入时从源码中查找，不提前导入
+def job_func_name(job_module, job_func):
+    if job_func:
+        return job_func
+    if job_module in job_modules:
+        return "main" if hasattr(job_modules[job_module], "main") else "run"
+    try:
+        spec = importlib.util.find_spec(job_module)
+        with open(spec.origin) as f:
+            tree = ast.parse(f.read())
+    except (ImportError, AttributeError, TypeError, OSError, SyntaxError, ValueError):
+        return "main"
+    names = [x.name for x in tree.body if isinstance(x, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    return "main" if "main" in names or "run" not in names else "run"
+
+
+def load_job_func(job_module, job_func):
+    if job_module not in job_modules:
+        start_time = time.time()
+        job_modules[job_module] = importlib.import_module(job_module)
+        print("{} Module {} imported in {:.1f}ms".format(time.time(), job_module, (time.time() - start_time) * 1000))
+    module = job_modules[job_module]
+    return module, getattr(module, job_func_name(job_module, job_func))
+
+
+# 逐个测量，避免并行的子进程互相影响耗时
+async def report_import_cost(jobs):
+    for job in jobs:
+        module = importCost.job_module(job)
+        if module is None:
+            continue
+        cost = await importCost.measure(module)
+        if cost is not None:
+            JOB_IMPORT_SECONDS.set(cost[0], job['job_name'])
+        print("{} Job {} {}".format(time.time(), job['job_name'], importCost.format_cost(module, cost)))
+
+
+def get_sink():
+    return esSink.get_sink(lambda: httpPool.get_pool().session)
+
+
+# 采集函数声明了session/sink参数时注入共享连接池的Session和ES写入点
+def inject_shared(func, job_kwargs):
+    kwargs = dict(job_kwargs)
+    params = inspect.signature(func).parameters
+    if "session" in params and "session" not in kwargs:
+        kwargs['session'] = httpPool.get_pool().session
+    if ES_SINK and "sink" in params and "sink" not in kwargs:
+        kwargs['sink'] = get_sink()
+    return kwargs
+
+
+def report_pool():
+    print("[{time}] [HttpPool] {stats} [EsSink] {sink} [EsSpool] {spool}".format(
+        time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        stats=httpPool.get_pool().stats(),
+        sink=get_sink().stats(),
+        spool=esSpool.get_spool().stats()))
+
+
+async def run_shell(job, messages, errors):
+    proc = await asyncio.create_subprocess_shell(job['job_command'],
+                                                 stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE,
+                                                 start_new_session=True,
+                                                 limit=jobOutput.JOB_OUTPUT_MAX_BYTES)
+    RUNNING_SUBPROCESSES.inc()
+    try:
+        await asyncio.gather(jobOutput.read_stream(proc.stdout, messages), jobOutput.read_stream(proc.stderr, errors))
+        exit_code = await proc.wait()
+        return exit_code, any(PUSH_FAILED_LINE in x for x in messages.lines)
+    except asyncio.CancelledError:
+        # 超时被取消时结束整个子进程组，避免遗留僵尸进程
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # 超时与结束之间子进程已退出
+            pass
+        await proc.wait()
+        raise
+    finally:
+        RUNNING_SUBPROCESSES.dec()
+
+
+async def run_python(job, messages, errors):
+    module, func = load_job_func(job['job_module'], job['job_func'])
+    result = await func(*job['job_args'], **inject_shared(func, job['job_kwargs']))
+    if hasattr(module, "format_result"):
+        messages.append(module.format_result(result))
+    elif result is not None:
+        messages.append("{}".format(result))
+    return 0, push_failed(result)
+
+
+# 采集函数的返回值为[文档数, [Http状态码, 响应]]；提交给esSink排队时尚无写入结果，不计为失败
+def push_failed(result):
+    try:
+        # ES不可达时为[文档数, None]
+        return result[1] is None or result[1][0] // 100 != 2 or bool(result[1][1].get('errors'))
+    except (TypeError, IndexError, KeyError, AttributeError):
+        return False
+
+
+def on_job_missed(event):
+    job = scheduler.get_job(event.job_id)
+    JOB_MISFIRES.inc(job.name if job is not None else event.job_id)
+
+
+def log_skipped(job_name, reason, count):
+    print("[{time}] [{name}] Skipped {count} run(s): {reason}".format(
+        time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()), name=job_name, count=count, reason=reason))
+
+
+# 统计两次提交之间被合并掉的触发时间点个数
+def count_coalesced(trigger, last_run_time, run_time, limit=1000):
+    count = 0
+    fire_time = trigger.get_next_fire_time(last_run_time, last_run_time)
+    while fire_time is not None and fire_time < run_time and count < limit:
+        count += 1
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+    return count
+
+
+def on_job_submitted(event):
+    job = scheduler.get_job(event.job_id)
+    if job is None or not event.scheduled_run_times:
+        return
+    run_time = event.scheduled_run_times[-1]
+    last_run_time = job_last_run_times.get(job.id)
+    job_last_run_times[job.id] = run_time
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        JOB_DROPPED.inc(job.name, "max_instances", amount=len(event.scheduled_run_times))
+        log_skipped(job.name, "maximum number of running instances reached ({})".format(job.max_instances),
+                    len(event.scheduled_run_times))
+    # 自适应触发器的间隔会变化、带jitter的触发器每次计算的时间点都不同，无法从触发器还原被合并的时间点
+    if job.coalesce and last_run_time is not None and not isinstance(job.trigger, jobTrigger.AdaptiveTrigger) \
+            and not getattr(job.trigger, "jitter", None):
+        coalesced = count_coalesced(job.trigger, last_run_time, run_time)
+        if coalesced:
+            JOB_COALESCED.inc(job.name, amount=coalesced)
+            log_skipped(job.name, "coalesced into the run at {}".format(run_time), coalesced)
+
+
+async def build_job(job):
+    # 上一次执行仍未结束时直接跳过，不在信号量上排队
+    if job['job_skip_if_running'] and job_running.get(job['job_name'], 0) > 0:
+        JOB_DROPPED.inc(job['job_name'], "running")
+        log_skipped(job['job_name'], "previous run still active", 1)
+        return
+    job_running[job['job_name']] = job_running.get(job['job_name'], 0) + 1
+    try:
+        await run_job(job)
+    finally:
+        job_running[job['job_name']] -= 1
+
+
+async def run_job(job):
+    job_queue_time_ts = time.time()
+    # 先取单Job信号量再取全局信号量，排队等待本Job的实例不占用全局并发数
+    async with get_semaphore(job['job_name'], job['job_concurrency']), get_semaphore(None, JOB_CONCURRENCY):
+        job_start_time_ts = time.time()
+        JOB_QUEUE_SECONDS.observe(job_start_time_ts - job_queue_time_ts, job['job_name'])
+        job_start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job_start_time_ts))
+        run_id = jobOutput.new_run_id()
+        messages = jobOutput.OutputBuffer()
+        errors = jobOutput.OutputBuffer()
+        runner = run_python if job['job_type'] == "python" else run_shell
+        try:
+            exit_code, failed_push = await asyncio.wait_for(runner(job, messages, errors),
+                                                            timeout=job['job_timeout'])
+        except asyncio.TimeoutError:
+            errors.append("Timeout after {}s".format(job['job_timeout']))
+            exit_code, failed_push = None, False
+        except Exception as e:
+            errors.append("{}: {}".format(type(e).__name__, e))
+            exit_code, failed_push = None, False
+        JOB_RUN_SECONDS.observe(time.time() - job_start_time_ts, job['job_name'])
+        if exit_code != 0:
+            JOB_FAILURES.inc(job['job_name'])
+        trigger = jobTrigger.adaptive_triggers.get(job['job_name'])
+        if trigger is not None:
+            failed = exit_code != 0 or failed_push
+            reason = trigger.record(time.time() - job_start_time_ts, failed)
+            JOB_INTERVAL_SECONDS.set(trigger.interval, job['job_name'])
+            if reason is not None:
+                messages.append("Backoff interval to {:g}s: {}".format(trigger.interval, reason))
+        print(jobOutput.format_run(job, run_id, job_start_time, exit_code, time.time() - job_start_time_ts,
+                                   messages, errors))
 
 
 if __name__ == '__main__':
-    scheduler = AsyncIOScheduler()
-    jobs = get_jobs()
-    for j in jobs:
-        job_args = [j['job_name'], j['job_command']]
-        scheduler.add_job(func=build_job, args=job_args, name=j['job_name'],
-                          misfire_grace_time=3600,
-                          trigger=IntervalTrigger(
-                              weeks=j['job_trigger'].get("weeks", 0),
-                              days=j['job_trigger'].get("days", 0),
-                              hours=j['job_trigger'].get("hours", 0),
-                              minutes=j['job_trigger'].get("minutes", 0),
-                              seconds=j['job_trigger'].get("seconds", 0),
-                              start_date=j['job_trigger'].get("start_date", None),
-                              end_date=j['job_trigger'].get("end_date", None),
-                              timezone=j['job_trigger'].get("timezone", None)
-                          ))
+    loop = asyncio.get_event_loop()
+    scheduler = AsyncIOScheduler(event_loop=loop)
+    initial_file_jobs = []
+    if jobReload.JOB_FILE:
+        try:
+            initial_file_jobs = jobReload.read_jobs(jobReload.JOB_FILE)
+        except Exception as ex:
+            print("{} entrypoint Read {} Error Message: {}".format(time.time(), jobReload.JOB_FILE, ex))
+    reload_jobs(initial_file_jobs)
+    if POOL_STATS_INTERVAL > 0:
+        scheduler.add_job(func=report_pool, id=INTERNAL_JOB_PREFIX + "HttpPool", name="HttpPool",
+                          trigger=IntervalTrigger(seconds=POOL_STATS_INTERVAL))
+    esSpool.get_spool().start(lambda: httpPool.get_pool().session, esBulk.ES_URL)
+    scheduler.add_listener(on_job_missed, EVENT_JOB_MISSED)
+    scheduler.add_listener(on_job_submitted, EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES)
+    if metrics.METRICS_PORT > 0:
+        metrics.REGISTRY.register_stats("http_pool", "Shared aiohttp pool statistics.", httpPool.get_pool().stats)
+        metrics.REGISTRY.register_stats("es_sink", "ES sink statistics.", lambda: get_sink().stats())
+        metrics.REGISTRY.register_stats("es_spool", "ES spool statistics.", esSpool.get_spool().stats)
+        metrics.REGISTRY.register_stats("docker_discovery", "Docker discovery statistics.",
+                                        dockerDiscovery.get_discovery().stats)
+        metrics.REGISTRY.register_stats("sample_store", "Local sample store statistics.",
+                                        sampleStore.get_store().stats)
+        metrics.REGISTRY.register_stats("change_filter", "Change filter statistics.",
+                                        changeFilter.get_filter().stats)
+        # 端口被占用(如host网络下的另一个容器)时不输出指标，继续调度
+        try:
+            loop.run_until_complete(metrics.serve())
+        except OSError as ex:
+            print("{} entrypoint Func metrics.serve() {}:{} Error Message: {}".format(time.time(), metrics.METRICS_HOST,
+                                                                                     metrics.METRICS_PORT, ex))
+        else:
+            asyncio.ensure_future(metrics.watch_loop_lag())
     pending_jobs = scheduler.get_jobs()
     print("Job_Num: {}, Job List:".format(len(pending_jobs)))
     for x in pending_jobs:
-        print("Job_name:{}, Job_command:{}, job_trigger:{}".format(x.name, x.args, x.trigger))
+        if x.args:
+            print("Job_name:{}, Job_command:{}, job_trigger:{}".format(x.name, x.args[0]['job_command'], x.trigger))
     scheduler.start()
+    if importCost.IMPORT_COST_REPORT:
+        asyncio.ensure_future(report_import_cost(list(job_definitions.values())))
+    if jobReload.JOB_FILE:
+        asyncio.ensure_future(jobReload.watch(jobReload.JOB_FILE, reload_jobs))
     print('Press Ctrl+{0} to exit'.format('Break' if os.name == 'nt' else 'C'))
     try:
-        asyncio.get_event_loop().run_forever()
+        loop.run_forever()
     except (KeyboardInterrupt, SystemExit):
         pass
     except Exception as e:
         print(e)
-
+    finally:
+        if "getDockerInfo" in job_modules:
+            loop.run_until_complete(job_modules["getDockerInfo"].close())
+        loop.run_until_complete(get_sink().close())
+        loop.run_until_complete(httpPool.get_pool().close())
+        loop.run_until_complete(hostInfo.close())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、ES _bulk请求体流式编码，逐条文档生成NDJSON字节块，替代字符串拼接
+2、每个索引的action header只生成一次
+3、可选gzip压缩(Content-Encoding: gzip)
+4、按字节数或文档数上限自动拆分为多个_bulk请求
+5、ES地址ES_URL统一在此定义，采集脚本、esSink及esSpool回放共用
+"""
+
+import os
+import json
+import time
+import zlib
+
+ES_URL = os.environ.get("ES_URL", "http://10.10.19.36:9200")
+BULK_MAX_BYTES = int(os.environ.get("BULK_MAX_BYTES", 5 * 1024 * 1024))
+BULK_MAX_DOCS = int(os.environ.get("BULK_MAX_DOCS", 5000))
+BULK_GZIP = os.environ.get("BULK_GZIP", "0") == "1"
+BULK_TIMEOUT = float(os.environ.get("BULK_TIMEOUT", 5))
+
+
+class BulkEncoder(object):
+
+    def __init__(self, max_bytes=BULK_MAX_BYTES, max_docs=BULK_MAX_DOCS, gzip=BULK_GZIP):
+        self._max_bytes = max_bytes
+        self._max_docs = max_docs
+        self._gzip = gzip
+        self._action_headers = {}
+        self.encode_seconds = 0.0
+
+    def _action_header(self, index_name):
+        if index_name not in self._action_headers:
+            self._action_headers[index_name] = json.dumps({"index": {"_index": index_name, "_type": "doc"}}).encode() + b"\n"
+        return self._action_headers[index_name]
+
+    # index_docs为(索引名, 文档)序列，按上限切分，每批为一次_bulk请求的[(header, doc)]列表
+    def batches(self, index_docs):
+        batch = []
+        batch_bytes = 0
+        for index_name, doc in index_docs:
+            start_time = time.time()
+            header = self._action_header(index_name)
+            line = json.dumps(doc).encode() + b"\n"
+            self.encode_seconds += time.time() - start_time
+            line_bytes = len(header) + len(line)
+            if batch and (batch_bytes + line_bytes > self._max_bytes or len(batch) >= self._max_docs):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append((header, line))
+            batch_bytes += line_bytes
+        if batch:
+            yield batch
+
+    # aiohttp将异步生成器作为chunked请求体流式发送
+    async def body(self, batch):
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if self._gzip else None
+        for header, line in batch:
+            if compressor is None:
+                yield header + line
+            else:
+                chunk = compressor.compress(header + line)
+                if chunk:
+                    yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    def headers(self):
+        headers = {'content-type': 'application/x-ndjson'}
+        if self._gzip:
+            headers['content-encoding'] = 'gzip'
+        return headers
+
+
+# 合并多次_bulk请求的返回: 任一请求失败则返回该结果，否则合并errors与items
+def merge_results(results):
+    items = []
+    errors = False
+    for result in results:
+        if result is None or result[0] // 100 != 2:
+            return result
+        errors = errors or result[1].get('errors', False)
+        items.extend(result[1].get('items', []))
+    return [results[-1][0], {"errors": errors, "items": items}] if results else None
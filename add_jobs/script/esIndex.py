@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、ES按天索引的生命周期管理，记住已确认存在的索引，写入前不再每次HEAD
+2、按索引前缀(container-{env}、service_jvm-{env})把ES_MAPPING安装为索引模板，当天索引由_bulk按模板自动创建，
+   已安装的模板按mapping的哈希记录，mapping变化(如增加汇总字段)时重新安装模板，并把新字段补到已有的当天及明天索引
+3、提前创建明天的索引，跨天时不产生额外请求
+4、状态持久化到本地文件(由stateFile读写)，命令行方式运行的采集脚本同样受益
+5、建模板/建索引整体不超过ES_INDEX_TIMEOUT(默认同_bulk超时)，失败或超时后ES_INDEX_RETRY_SECONDS内跳过，
+   ES无响应时采集不在建索引上等待，文档直接写入(失败则落盘)
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import asyncio
+import esBulk
+import stateFile
+
+ES_INDEX_STATE_FILE = os.environ.get("ES_INDEX_STATE_FILE", "/tmp/es_index_state.json")
+ES_INDEX_TIMEOUT = float(os.environ.get("ES_INDEX_TIMEOUT", esBulk.BULK_TIMEOUT))
+ES_INDEX_RETRY_SECONDS = float(os.environ.get("ES_INDEX_RETRY_SECONDS", 60))
+ELK_MAPPING_HEADERS = {'content-type': 'application/json'}
+INDEX_DATE_REGEX = re.compile(r'^(?P<prefix>.+)-\d{4}\.\d{2}\.\d{2}$')
+
+
+def mapping_hash(mapping):
+    return hashlib.md5(json.dumps(mapping, sort_keys=True).encode()).hexdigest()
+
+
+def index_name(prefix, days=0):
+    return "{}-{}".format(prefix, time.strftime("%Y.%m.%d", time.localtime(time.time() + days * 86400)))
+
+
+class IndexLifecycle(object):
+
+    def __init__(self, state_file=ES_INDEX_STATE_FILE, timeout=ES_INDEX_TIMEOUT, retry_seconds=ES_INDEX_RETRY_SECONDS):
+        self._state_file = state_file
+        self._timeout = timeout
+        self._retry_seconds = retry_seconds
+        # 索引前缀 -> 最近一次建索引失败的时间
+        self._failed = {}
+        # 索引前缀 -> 已安装模板的mapping哈希
+        self._templates = {}
+        self._indices = set()
+        self._stats = {"hit": 0, "template": 0, "create": 0, "failed": 0, "skipped": 0}
+        self.load()
+
+    def load(self):
+        state = stateFile.load(self._state_file, {})
+        templates = state.get('templates', {})
+        # 旧格式只记录了前缀，没有哈希，视为未安装
+        self._templates = templates if isinstance(templates, dict) else {}
+        self._indices = set(state.get('indices', []))
+        self._failed = state.get('failed', {})
+
+    def save(self):
+        # 只保留昨天及以后的索引记录
+        yesterday = time.strftime("%Y.%m.%d", time.localtime(time.time() - 86400))
+        self._indices = set(x for x in self._indices if x[-10:] >= yesterday)
+        stateFile.save(self._state_file, {"templates": self._templates, "indices": sorted(self._indices),
+                                          "failed": self._failed})
+
+    async def install_template(self, session, es_url, prefix, mapping):
+        template = {"index_patterns": ["{}-*".format(prefix)]}
+        template.update(mapping)
+        async with session.put('{}/_template/{}'.format(es_url, prefix), data=json.dumps(template),
+                               headers=ELK_MAPPING_HEADERS, timeout=self._timeout) as resp:
+            await resp.read()
+            if resp.status // 100 == 2:
+                self._templates[prefix] = mapping_hash(mapping)
+                self._stats['template'] += 1
+            return resp.status
+
+    # 已有索引的mapping只能新增字段，失败时(如字段已被动态映射为其他类型)打印后继续
+    async def update_mapping(self, session, es_url, name, mapping):
+        for doc_type, doc_mapping in mapping.get('mappings', {}).items():
+            async with session.put('{}/{}/_mapping/{}'.format(es_url, name, doc_type), data=json.dumps(doc_mapping),
+                                   headers=ELK_MAPPING_HEADERS, timeout=self._timeout) as resp:
+                result = await resp.read()
+                if resp.status // 100 != 2:
+                    print("{} esIndex Func update_mapping() {} Error Message: {} {}".format(time.time(), name,
+                                                                                         resp.status, result[:200]))
+
+    async def create_index(self, session, es_url, name, mapping):
+        async with session.put('{}/{}'.format(es_url, name), data=json.dumps(mapping),
+                               headers=ELK_MAPPING_HEADERS, timeout=self._timeout) as resp:
+            result = await resp.json()
+            # 索引已存在时ES返回400 resource_already_exists_exception
+            if resp.status // 100 == 2 or "already_exists" in json.dumps(result.get('error', "")):
+                self._indices.add(name)
+                self._stats['create'] += 1
+            return resp.status
+
+    # name为当天的索引名，例如container-sit-2018.11.20
+    async def ensure(self, session, es_url, name, mapping):
+        prefix = INDEX_DATE_REGEX.match(name).group('prefix')
+        if name in self._indices and index_name(prefix, 1) in self._indices \
+                and self._templates.get(prefix) == mapping_hash(mapping):
+            self._stats['hit'] += 1
+            return [200, "Index '{}' is already exists.".format(name)]
+        if time.time() - self._failed.get(prefix, 0) < self._retry_seconds:
+            self._stats['skipped'] += 1
+            return [503, "Index '{}' setup skipped after a recent failure.".format(name)]
+        try:
+            result = await asyncio.wait_for(self._ensure(session, es_url, prefix, name, mapping), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            self._record_failure(prefix)
+            raise asyncio.TimeoutError("Index '{}' setup timed out after {:g}s".format(name, self._timeout))
+        except Exception:
+            self._record_failure(prefix)
+            raise
+        if self._failed.pop(prefix, None) is not None:
+            self.save()
+        return result
+
+    def _record_failure(self, prefix):
+        self._failed[prefix] = time.time()
+        self._stats['failed'] += 1
+        self.save()
+
+    async def _ensure(self, session, es_url, prefix, name, mapping):
+        tomorrow = index_name(prefix, 1)
+        installed = self._templates.get(prefix)
+        if installed != mapping_hash(mapping):
+            status = await self.install_template(session, es_url, prefix, mapping)
+            if status // 100 == 2 and installed is not None:
+                for x in (name, tomorrow):
+                    if x in self._indices:
+                        await self.update_mapping(session, es_url, x, mapping)
+        if name not in self._indices:
+            if prefix in self._templates:
+                self._indices.add(name)
+            else:
+                await self.create_index(session, es_url, name, mapping)
+        if tomorrow not in self._indices:
+            await self.create_index(session, es_url, tomorrow, mapping)
+        self.save()
+        return [200, "Index '{}' is ready.".format(name)]
+
+    def stats(self):
+        result = dict(self._stats)
+        result['indices'] = len(self._indices)
+        return result
+
+
+_lifecycle = None
+
+
+def get_lifecycle():
+    global _lifecycle
+    if _lifecycle is None:
+        _lifecycle = IndexLifecycle()
+    return _lifecycle
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、进程内统一的ES写入点，python类型的采集Job把文档提交到这里，不再各自发送_bulk
+2、跨Job、跨周期合并文档，达到文档数上限或时间预算时刷新
+3、待写文档数有上限，超过时提交方等待刷新完成(背压)，内存占用有界
+4、按索引路由(container-*、service_jvm-*)，索引模板及按天索引由esIndex管理
+5、写入失败或超时的文档落盘到esSpool，由后台回放
+"""
+
+import os
+import time
+import asyncio
+import esBulk
+import esIndex
+import esSpool
+import metrics
+
+SINK_FLUSH_DOCS = int(os.environ.get("SINK_FLUSH_DOCS", 2000))
+SINK_FLUSH_INTERVAL = float(os.environ.get("SINK_FLUSH_INTERVAL", 5))
+SINK_MAX_PENDING = int(os.environ.get("SINK_MAX_PENDING", 20000))
+
+
+class EsSink(object):
+
+    def __init__(self, get_session, es_url=esBulk.ES_URL, flush_docs=SINK_FLUSH_DOCS,
+                 flush_interval=SINK_FLUSH_INTERVAL, max_pending=SINK_MAX_PENDING):
+        self._get_session = get_session
+        self._es_url = es_url
+        self._flush_docs = flush_docs
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending = []
+        self._mappings = {}
+        self._flusher = None
+        self._flush_now = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._stats = {"submitted": 0, "flushed": 0, "failed": 0, "requests": 0, "waits": 0}
+
+    async def submit(self, index_name, docs, mapping=None):
+        docs = list(docs)
+        self._start_flusher()
+        while self._pending and len(self._pending) + len(docs) > self._max_pending:
+            self._stats['waits'] += 1
+            self._not_full.clear()
+            self._flush_now.set()
+            await self._not_full.wait()
+        # 以最近一次提交的mapping为准，mapping变化时由esIndex重新安装模板
+        if mapping is not None:
+            self._mappings[index_name] = mapping
+        self._pending.extend((index_name, doc) for doc in docs)
+        self._stats['submitted'] += len(docs)
+        if len(self._pending) >= self._flush_docs:
+            self._flush_now.set()
+        return len(docs)
+
+    def _start_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+
+    async def _run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def _post(self, session, encoder, batch):
+        async with session.post('{}/_bulk'.format(self._es_url), data=encoder.body(batch), headers=encoder.headers(),
+                                timeout=esBulk.BULK_TIMEOUT) as resp:
+            return [resp.status, await resp.json()]
+
+    async def flush(self):
+        if not self._pending:
+            return None
+        index_docs = self._pending
+        self._pending = []
+        session = self._get_session()
+        encoder = esBulk.BulkEncoder()
+        results = []
+        # 建索引失败(如ES不可达)时仍继续写入，写入失败的文档落盘到esSpool
+        for index_name in set(x[0] for x in index_docs):
+            if index_name in self._mappings:
+                try:
+                    await esIndex.get_lifecycle().ensure(session, self._es_url, index_name, self._mappings[index_name])
+                except Exception as e:
+                    print("{} esSink Func es_index() {} Error Message: {}".format(time.time(), index_name, e))
+        try:
+            for batch in encoder.batches(index_docs):
+                self._stats['requests'] += 1
+                try:
+                    with metrics.stage("esSink", "bulk_push"):
+                        result = await self._post(session, encoder, batch)
+                except Exception as e:
+                    print("{} esSink Func flush() Error Message: {}".format(time.time(), e))
+                    result = None
+                esSpool.get_spool().spool_failed(batch, result)
+                results.append(result)
+            metrics.observe_stage("esSink", "bulk_encode", encoder.encode_seconds)
+        except Exception as e:
+            print("{} esSink Func flush() Error Message: {}".format(time.time(), e))
+        finally:
+            self._not_full.set()
+        result = esBulk.merge_results(results)
+        if result is not None and result[0] // 100 == 2 and not result[1]['errors']:
+            self._stats['flushed'] += len(index_docs)
+        else:
+            self._stats['failed'] += len(index_docs)
+            print("{} esSink Push failed. [{}] {} {}".format(time.time(), len(index_docs),
+                                                             result[0] if result is not None else None,
+                                                             sorted(set(x[0] for x in index_docs))))
+        return result
+
+    def stats(self):
+        result = dict(self._stats)
+        result['pending'] = len(self._pending)
+        return result
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
+
+
+_sink = None
+
+
+def get_sink(get_session):
+    global _sink
+    if _sink is None:
+        _sink = EsSink(get_session)
+    return _sink
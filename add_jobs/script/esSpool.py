@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、ES写入失败或超时时，把bulk文档(action header + doc)追加写入本地分段文件，采集结果不再丢失
+2、entrypoint进程内后台回放分段文件，失败时指数退避重试
+3、按_bulk返回的items逐条判断，只重新落盘可重试的失败文档(429/5xx)
+4、总大小有上限，超过时从最旧的分段开始淘汰
+"""
+
+import os
+import time
+import asyncio
+
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "/tmp/es_spool")
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 256 * 1024 * 1024))
+SPOOL_DRAIN_INTERVAL = float(os.environ.get("SPOOL_DRAIN_INTERVAL", 5))
+SPOOL_BACKOFF_MAX = float(os.environ.get("SPOOL_BACKOFF_MAX", 300))
+ELK_BULK_HEADERS = {'content-type': 'application/x-ndjson'}
+
+
+def retryable_status(status):
+    return status == 429 or status >= 500
+
+
+class EsSpool(object):
+
+    def __init__(self, spool_dir=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES):
+        self._spool_dir = spool_dir
+        self._max_bytes = max_bytes
+        self._seq = 0
+        self._drainer = None
+        self._stats = {"spooled": 0, "drained": 0, "dropped": 0, "evicted": 0}
+
+    def segments(self):
+        try:
+            return sorted(x for x in os.listdir(self._spool_dir) if x.endswith(".seg"))
+        except OSError:
+            return []
+
+    # 每次写入一个新分段: 先写.tmp再改名，回放方不会读到写了一半的文件
+    def append(self, batch):
+        if not batch:
+            return
+        try:
+            os.makedirs(self._spool_dir, exist_ok=True)
+            self._seq += 1
+            name = "{:013d}-{}-{}".format(int(time.time() * 1000), os.getpid(), self._seq)
+            tmp_file = os.path.join(self._spool_dir, name + ".tmp")
+            with open(tmp_file, "ab") as f:
+                for header, line in batch:
+                    f.write(header)
+                    f.write(line)
+            os.replace(tmp_file, os.path.join(self._spool_dir, name + ".seg"))
+            self._stats['spooled'] += len(batch)
+            self.evict()
+        except OSError as e:
+            print("{} esSpool Func append() Error Message: {}".format(time.time(), e))
+
+    @staticmethod
+    def _remove(path):
+        # 多个进程共用同一目录，文件可能已被其他进程回放或淘汰
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        segments = []
+        for name in self.segments():
+            try:
+                segments.append((name, os.path.getsize(os.path.join(self._spool_dir, name))))
+            except FileNotFoundError:
+                pass
+        total = sum(x[1] for x in segments)
+        for name, size in segments:
+            if total <= self._max_bytes:
+                break
+            self._remove(os.path.join(self._spool_dir, name))
+            total -= size
+            self._stats['evicted'] += 1
+
+    # 按_bulk结果落盘失败文档: 整批失败全部落盘，部分失败只落盘可重试的文档
+    def spool_failed(self, batch, result):
+        if result is None or result[0] // 100 != 2:
+            self.append(batch)
+        elif result[1].get('errors'):
+            retry = []
+            for pair, item in zip(batch, result[1].get('items', [])):
+                status = list(item.values())[0].get('status', 200)
+                if retryable_status(status):
+                    retry.append(pair)
+                elif status // 100 != 2:
+                    self._stats['dropped'] += 1
+            self.append(retry)
+
+    @staticmethod
+    def _read_segment(path):
+        batch = []
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        for i in range(0, len(lines) - 1, 2):
+            batch.append((lines[i], lines[i + 1]))
+        return batch
+
+    async def _post(self, session, es_url, batch):
+        async with session.post('{}/_bulk'.format(es_url), data=b"".join(x[0] + x[1] for x in batch),
+                                headers=ELK_BULK_HEADERS, timeout=10) as resp:
+            return [resp.status, await resp.json()]
+
+    async def drain(self, get_session, es_url):
+        failures = 0
+        while True:
+            segments = self.segments()
+            if not segments:
+                await asyncio.sleep(SPOOL_DRAIN_INTERVAL)
+                continue
+            path = os.path.join(self._spool_dir, segments[0])
+            try:
+                batch = self._read_segment(path)
+                result = await self._post(get_session(), es_url, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("{} esSpool Func drain() Error Message: {}".format(time.time(), e))
+                result = None
+            if result is None or retryable_status(result[0]):
+                failures += 1
+                await asyncio.sleep(min(SPOOL_DRAIN_INTERVAL * 2 ** (failures - 1), SPOOL_BACKOFF_MAX))
+                continue
+            failures = 0
+            self._remove(path)
+            if result[0] // 100 == 2:
+                self._stats['drained'] += len(batch)
+                self.spool_failed(batch, result)
+            else:
+                self._stats['dropped'] += len(batch)
+                print("{} esSpool Drop segment {} [Http Error Code({})]".format(time.time(), segments[0], result[0]))
+
+    def start(self, get_session, es_url):
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.ensure_future(self.drain(get_session, es_url))
+
+    def stats(self):
+        result = dict(self._stats)
+        result['segments'] = len(self.segments())
+        return result
+
+
+_spool = None
+
+
+def get_spool():
+    global _spool
+    if _spool is None:
+        _spool = EsSpool()
+    return _spool
@@ -3,16 +3,41 @@
 
 """
 1、判断container相关的索引是否存在，不存在则建立
-2、获取本地IP地址和主机名
+2、本地IP地址和主机名由hostInfo解析并缓存，Docker API地址(unix socket或TCP)同样由hostInfo决定
 3、通过Docker API获取容器信息
+4、stats_mode为stream时每个容器保持一条stats?stream=1长连接，推送时直接取最新样本
+5、容器元数据通过dockerMeta缓存获取，容器存活期间不重复inspect
+6、ES bulk请求体由esBulk流式编码，超过上限自动拆分
+7、进程内运行时可把文档提交给esSink统一合并写入
+8、索引模板及按天索引由esIndex管理，写入前不再每次HEAD
+9、bulk写入失败或超时的文档落盘到esSpool，由entrypoint后台回放
+10、各阶段耗时上报到metrics
+11、stats_mode为delta(默认)时使用one-shot方式获取stats，不等待Docker计算precpu_stats，
+    CPU使用率由本次与上一次样本的差值计算，上一次样本保存在内存及DOCKER_STATS_STATE_FILE中
+12、stats_mode为cgroup时由cgroupStats直接读取cgroup文件，不调用stats API，读取不到时退回delta方式
+13、容器列表及inspect由dockerDiscovery统一获取，DISCOVERY_TTL内与getJmxInfo共用同一份快照，文档@timestamp仍为采样时间
+14、rollup_seconds大于0时每次运行只把样本记录到sampleStore，到期后推送min/max/avg汇总文档
+15、配置deadband时由changeFilter丢弃与上一次推送相比未变化的文档，按heartbeat_seconds定期推送心跳
 """
 
-import socket
+import os
 import asyncio
 import aiohttp
 import time
 import json
 import sys
+import cgroupStats
+import changeFilter
+import dockerDiscovery
+import dockerMeta
+import esBulk
+import esIndex
+import esSpool
+import hostInfo
+import metrics
+import sampleStore
+import stateFile
+from httpPool import session_scope
 
 ES_MAPPING = {
     "settings": {
@@ -80,37 +105,62 @@ ES_MAPPING = {
     }
 }
 
-ES_URL = "http://10.10.19.36:9200"
-ELK_MAPPING_HEADERS = {'content-type': 'application/json'}
-ELK_BULK_HEADERS = {'content-type': 'application/x-ndjson'}
+STATS_STREAM_READ_TIMEOUT = 30
+STATS_STREAM_MAX_AGE = 30
+DOCKER_STATS_STATE_FILE = os.environ.get("DOCKER_STATS_STATE_FILE", "/tmp/docker_stats_state.json")
+# 汇总时计算min/max/avg的字段
+ROLLUP_FIELDS = ("cpu_usage", "per_cpu_usage", "mem_usage")
+# 变化检测时不比较的字段: per_cpu_usage由cpu_usage换算，samples为汇总的样本数
+CHANGE_IGNORE_FIELDS = ("per_cpu_usage", "per_cpu_usage_min", "per_cpu_usage_max", "samples")
 
 
-def get_hostname_ip():
-    def get_host_ip():
-        sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            sk.connect(('8.8.8.8', 80))
-            ip = sk.getsockname()[0]
-        finally:
-            sk.close()
-        return ip
-    return [get_host_ip(), socket.gethostname()]
+# 每个容器上一次的CPU样本，格式与stats中的precpu_stats一致
+class CpuSamples(object):
+
+    def __init__(self, state_file=DOCKER_STATS_STATE_FILE):
+        self._state_file = state_file
+        self._samples = {}
+        self.load()
+
+    def load(self):
+        self._samples = stateFile.load(self._state_file, {})
+
+    def save(self):
+        stateFile.save(self._state_file, self._samples)
+
+    def get(self, con_id):
+        return self._samples.get(con_id)
+
+    def update(self, con_id, cpu_stats):
+        self._samples[con_id] = {"cpu_usage": {"total_usage": cpu_stats['cpu_usage']['total_usage']},
+                                 "system_cpu_usage": cpu_stats['system_cpu_usage']}
+
+    def prune(self, live_ids):
+        for con_id in [x for x in self._samples.keys() if x not in live_ids]:
+            del self._samples[con_id]
+
+
+_cpu_samples = None
+
+
+def get_cpu_samples():
+    global _cpu_samples
+    if _cpu_samples is None:
+        _cpu_samples = CpuSamples()
+    return _cpu_samples
 
 
 class GetDockerData(object):
 
-    def __init__(self):
-        self._host_info = get_hostname_ip()
-        self._prefix = "http://{host_ip}:2375".format(host_ip=self._host_info[0])
+    def __init__(self, stats_mode="delta"):
+        self._host_info = hostInfo.get_host_info()
+        self._prefix = hostInfo.docker_prefix()
         self._cons_info = {}
-
-    @staticmethod
-    def __utils(env_list):
-        result = {}
-        for item in env_list:
-            key, value = item.split("=", 1)
-            result.update({key: value})
-        return result
+        self._snapshot = None
+        self._stats_mode = stats_mode
+        self._stream_session = None
+        self._streams = {}
+        self._latest_stats = {}
 
     @staticmethod
     def __calculate_cons_cpu_usage(cpu_usage, pre_cpu_usage, sys_cpu_usage, pre_sys_cpu_usage, online_cpus):
@@ -133,17 +183,14 @@ class GetDockerData(object):
         async with session.get(url, timeout=10) as resp:
             return [resp.status, await resp.json()]
 
+    # 容器列表及inspect结果来自dockerDiscovery的快照
     async def get_cons(self, session):
-        url = "{prefix}/containers/json".format(prefix=self._prefix)
-        cons_id = []
-        cons_result = await self.__http_client(url, session)
-        if cons_result[0] // 100 == 2:
-            for con in cons_result[1]:
-                cons_id.append(con['Id'])
-                self._cons_info.update({
-                    con['Id']: {}
-                })
-        return cons_id
+        self._snapshot = await dockerDiscovery.get_discovery().snapshot(self._prefix, session)
+        for con_id in self._snapshot.containers.keys():
+            self._cons_info.update({
+                con_id: {}
+            })
+        return list(self._snapshot.containers.keys())
 
     async def get_con_info(self, con_id, session):
         def trans_byte_cpu(byte):
@@ -165,7 +212,7 @@ class GetDockerData(object):
                 return "{}MB".format(format(float(byte), '0.0f'))
 
         def get_env(con_env_info):
-            env_list = self.__utils(con_env_info['Config']['Env'])
+            env_list = self._snapshot.env(con_id)
             if "MARATHON_APP_ID" in env_list:
                 sn = env_list['MARATHON_APP_ID']
             else:
@@ -184,43 +231,148 @@ class GetDockerData(object):
                 ml = con_env_info['HostConfig']['Memory'] / 1024 / 1024
             return sn, hp, cl, ml
 
-        url = "{prefix}/containers/{con_id}/json".format(prefix=self._prefix, con_id=con_id)
-        con_info = await self.__http_client(url, session)
-        if con_info[0] // 100 == 2:
-            service_name, host_port, cpu_limit, mem_limit = get_env(con_info[1])
-            self._cons_info[con_id].update({
-                "service_name": service_name,
-                "host_port": host_port,
-                "cpu_limit": trans_byte_cpu(cpu_limit),
-                "mem_limit": trans_byte_mem(mem_limit),
-                "host": self._host_info
-            })
+        service_name, host_port, cpu_limit, mem_limit = get_env(self._snapshot.containers[con_id])
+        self._cons_info[con_id].update({
+            "service_name": service_name,
+            "host_port": host_port,
+            "cpu_limit": trans_byte_cpu(cpu_limit),
+            "mem_limit": trans_byte_mem(mem_limit),
+            "host": self._host_info
+        })
+
+    def __parse_con_stats(self, stats, pre_stats=None):
+        pre_stats = pre_stats or stats['precpu_stats']
+        cpu_usage = stats['cpu_stats']['cpu_usage']['total_usage']
+        pre_cpu_usage = pre_stats.get('cpu_usage', {}).get('total_usage', 0)
+        sys_cpu_usage = stats['cpu_stats']['system_cpu_usage']
+        pre_sys_cpu_usage = pre_stats.get('system_cpu_usage', 0)
+        online_cpus = stats['cpu_stats']['online_cpus']
+        mem_usage = stats['memory_stats']['usage']
+        mem_limit = stats['memory_stats']['limit']
+        return {
+            "@timestamp": time.time() * 1000,
+            "cpu_usage": self.__calculate_cons_cpu_usage(cpu_usage, pre_cpu_usage, sys_cpu_usage,
+                                                         pre_sys_cpu_usage, online_cpus),
+            "mem_usage": self.__calculate_cons_mem_usage(mem_usage, mem_limit)
+        }
 
     async def get_con_stats(self, con_id, session):
         url = "{prefix}/containers/{con_id}/stats?stream=0".format(prefix=self._prefix, con_id=con_id)
-        con_stats = await self.__http_client(url, session)
+        with metrics.stage("getDockerInfo", "docker_stats"):
+            con_stats = await self.__http_client(url, session)
         if con_stats[0] // 100 == 2:
-            cpu_usage = con_stats[1]['cpu_stats']['cpu_usage']['total_usage']
-            pre_cpu_usage = con_stats[1]['precpu_stats']['cpu_usage']['total_usage']
-            sys_cpu_usage = con_stats[1]['cpu_stats']['system_cpu_usage']
-            pre_sys_cpu_usage = con_stats[1]['precpu_stats']['system_cpu_usage']
-            online_cpus = con_stats[1]['cpu_stats']['online_cpus']
-            mem_usage = con_stats[1]['memory_stats']['usage']
-            mem_limit = con_stats[1]['memory_stats']['limit']
-            self._cons_info[con_id].update({
-                "@timestamp": time.time() * 1000,
-                "cpu_usage": self.__calculate_cons_cpu_usage(cpu_usage, pre_cpu_usage, sys_cpu_usage,
-                                                             pre_sys_cpu_usage, online_cpus),
-                "mem_usage": self.__calculate_cons_mem_usage(mem_usage, mem_limit)
-            })
+            self._cons_info[con_id].update(self.__parse_con_stats(con_stats[1]))
+            get_cpu_samples().update(con_id, con_stats[1]['cpu_stats'])
+
+    # one-shot立即返回当前计数，与上一次样本做差；没有上一次样本时退回普通stats请求
+    async def get_con_delta_stats(self, con_id, session):
+        pre_stats = get_cpu_samples().get(con_id)
+        if pre_stats is None:
+            return await self.get_con_stats(con_id, session)
+        url = "{prefix}/containers/{con_id}/stats?stream=0&one-shot=true".format(prefix=self._prefix, con_id=con_id)
+        with metrics.stage("getDockerInfo", "docker_stats"):
+            con_stats = await self.__http_client(url, session)
+        if con_stats[0] // 100 == 2:
+            self._cons_info[con_id].update(self.__parse_con_stats(con_stats[1], pre_stats))
+            get_cpu_samples().update(con_id, con_stats[1]['cpu_stats'])
+
+    # 读取失败时返回None，由各容器自行读取并在失败时退回delta方式
+    @staticmethod
+    def read_cgroup_host():
+        try:
+            return cgroupStats.read_host()
+        except (OSError, ValueError) as e:
+            print("{} getDockerInfo Func read_cgroup_host() Error Message: {}".format(time.time(), e))
+            return None
 
-    async def run(self):
+    # cgroup计数与stats API同源(纳秒)，可与delta方式的样本混用
+    async def get_con_cgroup_stats(self, con_id, session, host=None):
+        pre_stats = get_cpu_samples().get(con_id)
+        try:
+            with metrics.stage("getDockerInfo", "cgroup_stats"):
+                con_stats = cgroupStats.read_stats(con_id, host)
+        except (OSError, ValueError, KeyError) as e:
+            print("{} getDockerInfo Func get_con_cgroup_stats() Error Message: {}".format(time.time(), e))
+            con_stats = None
+        if con_stats is None or pre_stats is None:
+            return await self.get_con_delta_stats(con_id, session)
+        self._cons_info[con_id].update(self.__parse_con_stats(con_stats, pre_stats))
+        get_cpu_samples().update(con_id, con_stats['cpu_stats'])
+
+    # 持续读取stats流(NDJSON，每行一帧)，只保留最新样本；容器停止后Docker关闭连接，任务随之退出
+    async def watch_con_stats(self, con_id):
+        url = "{prefix}/containers/{con_id}/stats?stream=1".format(prefix=self._prefix, con_id=con_id)
+        try:
+            async with self._stream_session.get(url) as resp:
+                if resp.status // 100 == 2:
+                    async for line in resp.content:
+                        if line.strip():
+                            self._latest_stats[con_id] = self.__parse_con_stats(json.loads(line))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("{} getDockerInfo Func watch_con_stats() {} Error Message: {}".format(time.time(), con_id[:12], e))
+        finally:
+            if self._streams.get(con_id) is asyncio.current_task():
+                del self._streams[con_id]
+                self._latest_stats.pop(con_id, None)
+
+    # 按当前容器列表打开新容器的stats流，关闭已消失容器的stats流
+    def sync_con_streams(self, cons_list):
+        if self._stream_session is None or self._stream_session.closed:
+            self._stream_session = aiohttp.ClientSession(
+                connector=hostInfo.docker_connector(limit=0),
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=STATS_STREAM_READ_TIMEOUT))
+        for con_id in cons_list:
+            if con_id not in self._streams:
+                self._streams[con_id] = asyncio.ensure_future(self.watch_con_stats(con_id))
+        for con_id in [x for x in self._streams.keys() if x not in cons_list]:
+            self._streams.pop(con_id).cancel()
+            self._latest_stats.pop(con_id, None)
+
+    async def close_streams(self):
+        for task in self._streams.values():
+            task.cancel()
+        self._streams = {}
+        self._latest_stats = {}
+        if self._stream_session is not None and not self._stream_session.closed:
+            await self._stream_session.close()
+
+    # 流中暂无样本或样本过旧时退回一次性stats请求
+    async def get_con_latest_stats(self, con_id, session):
+        latest = self._latest_stats.get(con_id)
+        if latest is not None and time.time() * 1000 - latest['@timestamp'] < STATS_STREAM_MAX_AGE * 1000:
+            self._cons_info[con_id].update(latest)
+        else:
+            await self.get_con_stats(con_id, session)
+
+    async def run(self, session=None):
         if self._host_info[0] is not None:
-            async with aiohttp.ClientSession() as session:
-                cons_list = await asyncio.ensure_future(self.get_cons(session))
-                cons_info = [asyncio.ensure_future(self.get_con_info(x, session)) for x in cons_list]
-                cons_stats = [asyncio.ensure_future(self.get_con_stats(x, session)) for x in cons_list]
-                await asyncio.wait(cons_info + cons_stats)
+            self._cons_info = {}
+            meta_cache = dockerMeta.get_cache()
+            async with hostInfo.docker_session_scope(session) as docker_session:
+                if session is not None:
+                    meta_cache.watch(self._prefix, docker_session)
+                cons_list = await asyncio.ensure_future(self.get_cons(docker_session))
+                cons_info = [asyncio.ensure_future(self.get_con_info(x, docker_session)) for x in cons_list]
+                if self._stats_mode == "stream":
+                    self.sync_con_streams(cons_list)
+                    cons_stats = [asyncio.ensure_future(self.get_con_latest_stats(x, docker_session))
+                                  for x in cons_list]
+                elif self._stats_mode == "delta":
+                    cons_stats = [asyncio.ensure_future(self.get_con_delta_stats(x, docker_session))
+                                  for x in cons_list]
+                elif self._stats_mode == "cgroup":
+                    host = self.read_cgroup_host()
+                    cons_stats = [asyncio.ensure_future(self.get_con_cgroup_stats(x, docker_session, host))
+                                  for x in cons_list]
+                else:
+                    cons_stats = [asyncio.ensure_future(self.get_con_stats(x, docker_session)) for x in cons_list]
+                if cons_list:
+                    await asyncio.wait(cons_info + cons_stats)
+            if self._stats_mode in ("delta", "cgroup"):
+                get_cpu_samples().prune(cons_list)
+                get_cpu_samples().save()
             for con_id in self._cons_info.keys():
                 per_cpu_usage = self._cons_info[con_id]['cpu_usage'] / float(self._cons_info[con_id]['cpu_limit'])
                 self._cons_info[con_id].update({
@@ -233,9 +385,10 @@ class GetDockerData(object):
 
 class PushEsData(object):
 
-    def __init__(self, env_name, containers_stats):
+    def __init__(self, env_name, containers_stats, mapping=ES_MAPPING):
         self._env_name = env_name
         self._containers_stats = containers_stats
+        self._mapping = mapping
 
     def _es_index_name(self):
         es_index_name = "container-" + "{}-".format(self._env_name) + time.strftime("%Y.%m.%d", time.localtime())
@@ -246,7 +399,8 @@ class PushEsData(object):
     async def _async_http(session, url, method, **kwargs):
         try:
             if method == 'post':
-                async with session.post(url, data=kwargs['data'], headers=kwargs['headers'], timeout=10) as resp:
+                async with session.post(url, data=kwargs['data'], headers=kwargs['headers'],
+                                        timeout=kwargs.get('timeout', 10)) as resp:
                     return [resp.status, await resp.json()]
             elif method == 'put':
                 async with session.put(url, data=kwargs['data'], headers=kwargs['headers'], timeout=10) as resp:
@@ -260,65 +414,117 @@ class PushEsData(object):
             print("{} getDockerInfo Func async_http() Error Message: {}".format(time.time(), e))
 
     # 如果没有索引则创建，如果有则pass
+    # 索引及模板由esIndex统一管理，已知存在时不再发送HEAD
     async def check_index_mapping(self, session):
-        # 查看索引状态
-        async def is_index():
-            return await self._async_http(session=session,
-                                          url='{}/{}'.format(ES_URL, self._es_index_name()),
-                                          method='head')
-
-        # 创建索引
-        async def create_index():
-            return await self._async_http(session=session,
-                                          url='{}/{}'.format(ES_URL, self._es_index_name()),
-                                          method='put',
-                                          data=json.dumps(ES_MAPPING),
-                                          headers=ELK_MAPPING_HEADERS)
         try:
-            index_status = await is_index()
-            if index_status[0] // 100 != 2:
-                return await create_index()
-            else:
-                return [index_status[0], "Index 'marathon' is already exists."]
+            return await esIndex.get_lifecycle().ensure(session, esBulk.ES_URL, self._es_index_name(), self._mapping)
         except Exception as e:
             print("{} getDockerInfo {} Func es_index() Error Message: {}".format(time.time(), self._env_name, e))
 
     def _init_es_data(self):
         if isinstance(self._containers_stats, dict):
-            result = ""
-            es_header = '{"index": {"_index": ' + '"{}", '.format(self._es_index_name()) + '"_type": "doc"}}\n'
-            for i in self._containers_stats.values():
-                result = result + es_header + '{}\n'.format(json.dumps(i))
-            return [len(self._containers_stats.values()), result]
+            index_name = self._es_index_name()
+            return [len(self._containers_stats.values()), ((index_name, i) for i in self._containers_stats.values())]
         else:
             return [0, None]
 
     async def push(self, session):
         write_data = self._init_es_data()
         if write_data[0] > 0:
-            run_push = await self._async_http(session=session,
-                                              url='{}/_bulk'.format(ES_URL),
-                                              method='post',
-                                              data=write_data[1],
-                                              headers=ELK_BULK_HEADERS)
-            return [write_data[0], run_push]
-
-    async def run(self):
-        async with aiohttp.ClientSession() as session:
+            encoder = esBulk.BulkEncoder()
+            results = []
+            for batch in encoder.batches(write_data[1]):
+                with metrics.stage("getDockerInfo", "bulk_push"):
+                    result = await self._async_http(session=session,
+                                                    url='{}/_bulk'.format(esBulk.ES_URL),
+                                                    method='post',
+                                                    data=encoder.body(batch),
+                                                    headers=encoder.headers(),
+                                                    timeout=esBulk.BULK_TIMEOUT)
+                esSpool.get_spool().spool_failed(batch, result)
+                results.append(result)
+            metrics.observe_stage("getDockerInfo", "bulk_encode", encoder.encode_seconds)
+            return [write_data[0], esBulk.merge_results(results)]
+
+    # 提交给进程内的esSink，由其合并写入，返回值与push一致
+    async def submit(self, sink):
+        write_data = self._init_es_data()
+        if write_data[0] > 0:
+            count = await sink.submit(self._es_index_name(), (x[1] for x in write_data[1]), self._mapping)
+            return [count, [202, {"errors": False, "queued": True}]]
+
+    async def run(self, session=None, sink=None):
+        if sink is not None:
+            return await self.submit(sink)
+        async with session_scope(session) as session:
             await self.check_index_mapping(session)
             result = await self.push(session)
         return result
 
 
-async def main(env_name):
-    get_data = GetDockerData()
-    containers_stats = await get_data.run()
+_stream_collectors = {}
+
+
+async def close():
+    for get_data in _stream_collectors.values():
+        await get_data.close_streams()
+
+
+async def main(env_name, session=None, stats_mode="delta", sink=None, rollup_seconds=0,
+               deadband=changeFilter.CHANGE_DEADBAND, heartbeat_seconds=changeFilter.CHANGE_HEARTBEAT_SECONDS):
+    # stream模式需跨周期保留stats长连接，按环境复用同一个采集对象
+    if stats_mode == "stream":
+        if env_name not in _stream_collectors:
+            _stream_collectors[env_name] = GetDockerData(stats_mode=stats_mode)
+        get_data = _stream_collectors[env_name]
+    else:
+        get_data = GetDockerData(stats_mode=stats_mode)
+    containers_stats = await get_data.run(session)
+    mapping = ES_MAPPING
+    if containers_stats is not None and rollup_seconds:
+        count = len(containers_stats)
+        containers_stats = sampleStore.get_store().sample("container-{}".format(env_name), containers_stats,
+                                                          ROLLUP_FIELDS, rollup_seconds)
+        if containers_stats is None:
+            return [count, [200, {"errors": False, "sampled": True}]]
+        mapping = sampleStore.rollup_mapping(ES_MAPPING, ROLLUP_FIELDS)
+    if containers_stats and deadband is not None:
+        count = len(containers_stats)
+        containers_stats = changeFilter.get_filter().filter("container-{}".format(env_name), containers_stats,
+                                                            deadband, heartbeat_seconds, CHANGE_IGNORE_FIELDS)
+        if not containers_stats:
+            return [count, [200, {"errors": False, "unchanged": True}]]
     if containers_stats is not None:
-        push_data = PushEsData(env_name=env_name, containers_stats=containers_stats)
-        push_result = await push_data.run()
+        push_data = PushEsData(env_name=env_name, containers_stats=containers_stats, mapping=mapping)
+        push_result = await push_data.run(session, sink)
+        if deadband is not None and changeFilter.push_succeeded(push_result):
+            changeFilter.get_filter().commit("container-{}".format(env_name), containers_stats,
+                                             CHANGE_IGNORE_FIELDS)
         return push_result
 
 
+def format_result(task_result):
+    if task_result is not None:
+        # ES不可达时bulk请求没有响应
+        if task_result[1] is None:
+            return "{} getDockerInfo Push failed. [No Response]".format(time.time())
+        if task_result[1][0] // 100 == 2:
+            if task_result[1][1].get('sampled'):
+                return "{} getDockerInfo Sampled. [{}]".format(time.time(), task_result[0])
+            if task_result[1][1].get('unchanged'):
+                return "{} getDockerInfo Unchanged. [{}]".format(time.time(), task_result[0])
+            if task_result[1][1].get('queued'):
+                return "{} getDockerInfo Queued. [{}]".format(time.time(), task_result[0])
+            if task_result[1][1]['errors']:
+                return "{} getDockerInfo Push failed. [{}]".format(time.time(), task_result[0])
+            else:
+                return "{} getDockerInfo Push success. [{}]".format(time.time(), task_result[0])
+        else:
+            return "{} getDockerInfo Push failed. [Http Error Code({})]".format(time.time(), task_result[1][0])
+    else:
+        return "{} getDockerInfo No Data to Push.".format(time.time())
+
+
 if __name__ == '__main__':
     if (len(sys.argv) - 1) != 1 or sys.argv[1] not in ["pro", "uat", "perf", "sit"]:
         print("{} getDockerInfo parameter Error.".format(time.time()))
@@ -327,18 +533,6 @@ if __name__ == '__main__':
             loop = asyncio.get_event_loop()
             task = asyncio.ensure_future(main(env_name=sys.argv[1]))
             loop.run_until_complete(task)
-            task_result = task.result()
-            if task_result is not None:
-                if task_result[1][0] // 100 == 2:
-                    if task_result[1][1]['errors']:
-                        print("{} getDockerInfo Push failed. [{}]".format(time.time(), task_result[0]))
-                        pass
-                    else:
-                        print("{} getDockerInfo Push success. [{}]".format(time.time(), task_result[0]))
-                else:
-                    print("{} getDockerInfo Push failed. [Http Error Code({})]".format(time.time(), task_result[1][0]))
-            else:
-                print("{} getDockerInfo No Data to Push.".format(time.time()))
+            print(format_result(task.result()))
         except Exception as ex:
             print("{} getDockerInfo {}".format(time.time(), ex))
-
@@ -2,19 +2,42 @@
 # -*- coding:utf-8 -*-
 
 """
-1、获取本机信息，IP地址和主机名
-2、从本机docker API获取Container列表
+1、获取本机信息，IP地址和主机名(由hostInfo解析并缓存)
+2、从本机docker API获取Container列表(unix socket或TCP，由hostInfo决定)
 3、从本机docker API获取Container Config Env，先甄别出带有“JAVA_OPTS”字段的应用，并记录其IP及Port
 4、使用Container IP及Port访问Jmx API，获取Jmx数据
 5、构造ES数据，推送到ES
+6、容器Config Env通过dockerMeta缓存获取，容器存活期间不重复inspect
+7、ES bulk请求体由esBulk流式编码，超过上限自动拆分
+8、进程内运行时可把文档提交给esSink统一合并写入
+9、索引模板及按天索引由esIndex管理，写入前不再每次HEAD
+10、bulk写入失败或超时的文档落盘到esSpool，由entrypoint后台回放
+11、Jmx采集并发数有上限，每个Endpoint按近期耗时自适应读超时，整体截止时间到达时只推送已完成的数据
+12、流式读取/admin/metrics响应体，只解析需要的Key，采集的Key可按Job配置(jmx_metrics参数)
+13、各阶段耗时上报到metrics
+14、容器列表及inspect由dockerDiscovery统一获取，DISCOVERY_TTL内与getDockerInfo共用同一份快照，文档@timestamp仍为采集时间
+15、rollup_seconds大于0时每次运行只把样本记录到sampleStore，到期后推送min/max/avg汇总文档
+16、配置deadband时由changeFilter丢弃与上一次推送相比未变化的文档，按heartbeat_seconds定期推送心跳
 """
 
-import aiohttp
+import os
+import copy
+import codecs
 import asyncio
-import socket
+import aiohttp
 import time
-import json
 import sys
+import changeFilter
+import dockerDiscovery
+import dockerMeta
+import esBulk
+import esIndex
+import esSpool
+import hostInfo
+import jsonStream
+import metrics
+import sampleStore
+from httpPool import session_scope
 
 
 ES_MAPPING = {
@@ -74,32 +97,45 @@ ES_MAPPING = {
     }
 }
 
-ES_URL = "http://10.10.19.36:9200"
-ELK_MAPPING_HEADERS = {'content-type': 'application/json'}
-ELK_BULK_HEADERS = {'content-type': 'application/x-ndjson'}
+JMX_CONCURRENCY = int(os.environ.get("JMX_CONCURRENCY", 20))
+JMX_CONNECT_TIMEOUT = float(os.environ.get("JMX_CONNECT_TIMEOUT", 2))
+JMX_READ_TIMEOUT_MIN = float(os.environ.get("JMX_READ_TIMEOUT_MIN", 1))
+JMX_READ_TIMEOUT_MAX = float(os.environ.get("JMX_READ_TIMEOUT_MAX", 10))
+JMX_DEADLINE = float(os.environ.get("JMX_DEADLINE", 8))
+JMX_CHUNK_SIZE = 8192
+# 截止时间到达后再等待的秒数，让按剩余时间截断的读超时先触发并记录耗时
+JMX_DEADLINE_GRACE = 0.1
+# 变化检测时不比较汇总的样本数
+CHANGE_IGNORE_FIELDS = ("samples",)
+# ES字段名 -> /admin/metrics中的Key
+JMX_METRICS = {
+    "Maximum_Heap": "heap",
+    "Heap_Used": "heap.used",
+    "Non-Heap": "nonheap",
+    "Threads": "threads"
+}
 
+# 每个Jmx Endpoint的近期耗时(EWMA，秒)，进程内运行时跨周期保留
+jmx_latency = {}
 
-def get_hostname_ip():
-    def get_host_ip():
-        sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            sk.connect(('8.8.8.8', 80))
-            ip = sk.getsockname()[0]
-        finally:
-            sk.close()
-        return ip
-    # return [get_host_ip(), socket.gethostname()]
-    return ["172.16.5.33", socket.gethostname()]
+
+def es_mapping(jmx_metrics):
+    mapping = copy.deepcopy(ES_MAPPING)
+    properties = mapping['mappings']['doc']['properties']
+    for field in jmx_metrics.keys():
+        properties.setdefault(field, {"type": "float"})
+    return mapping
 
 
 async def async_http(session, url, method, **kwargs):
     # noinspection PyBroadException
     try:
         if method == 'post':
-            async with session.post(url, data=kwargs['data'], headers=kwargs['headers'], timeout=15) as resp:
+            async with session.post(url, data=kwargs['data'], headers=kwargs['headers'],
+                                    timeout=kwargs.get('timeout', 15)) as resp:
                 return [resp.status, await resp.json()]
         elif method == 'get':
-            async with session.get(url, timeout=15) as resp:
+            async with session.get(url, timeout=kwargs.get('timeout', 15)) as resp:
                 return [resp.status, await resp.text()]
         elif method == 'put':
             async with session.put(url, data=kwargs['data'], headers=kwargs['headers'], timeout=15) as resp:
@@ -113,116 +149,193 @@ async def async_http(session, url, method, **kwargs):
         print(f"{time.time()} getJmxInfo Func async_http() Error Message: {e}")
 
 
-async def get_cons_list(docker_prefix, session):
-    url = f"{docker_prefix}/containers/json"
-    cons_result = await async_http(session=session, url=url, method='get')
-    if cons_result[0] // 100 == 2:
-        for con in json.loads(cons_result[1]):
-            cons_info.update({
-                con['Id']: {}
-            })
-
-
-def utils(env_list):
-    result = {}
-    for item in env_list:
-        key, value = item.split("=", 1)
-        result.update({key: value})
-    return result
-
-
-async def get_cons_info(docker_prefix, con_id, session, host_info):
-    url = f"{docker_prefix}/containers/{con_id}/json"
-    con_info = await async_http(session=session, url=url, method='get')
-    if con_info[0] // 100 == 2:
-        con_env = utils(json.loads(con_info[1])['Config']['Env'])
-        m_key = {"JAVA_OPTS", "MARATHON_APP_ID"}
-        if set(m_key).issubset(list(con_env.keys())):
-            cons_info[con_id].update({
-                "jmx_prefix": f"http://{con_env['LIBPROCESS_IP']}:{con_env['PORT0']}",
-                "service_name": con_env['MARATHON_APP_ID'],
-                "host_port": f"{con_env['LIBPROCESS_IP']}_{con_env['PORT0']}",
-                "host": host_info
-            })
-        else:
-            del cons_info[con_id]
+# 容器列表及inspect结果来自dockerDiscovery的快照，只保留带JAVA_OPTS、MARATHON_APP_ID的容器
+def get_cons_info(snapshot, host_info, cons_info):
+    for con_id, con_env in snapshot.jvm_containers().items():
+        cons_info[con_id] = {
+            "jmx_prefix": f"http://{con_env['LIBPROCESS_IP']}:{con_env['PORT0']}",
+            "service_name": con_env['MARATHON_APP_ID'],
+            "host_port": f"{con_env['LIBPROCESS_IP']}_{con_env['PORT0']}",
+            "host": host_info
+        }
+
+
+# 读超时取近期耗时的4倍，限制在[JMX_READ_TIMEOUT_MIN, JMX_READ_TIMEOUT_MAX]之间，没有历史时取上限，
+# 整个请求不超过距截止时间的剩余秒数
+def jmx_timeout(jmx_prefix, remaining=None):
+    latency = jmx_latency.get(jmx_prefix)
+    if latency is None:
+        read_timeout = JMX_READ_TIMEOUT_MAX
+    else:
+        read_timeout = min(max(latency * 4, JMX_READ_TIMEOUT_MIN), JMX_READ_TIMEOUT_MAX)
+    return aiohttp.ClientTimeout(total=remaining, sock_connect=JMX_CONNECT_TIMEOUT, sock_read=read_timeout)
 
 
-async def get_jmx_info(jmx_prefix, con_id, session):
+# 分块读取响应体并增量解析，需要的Key全部拿到后不再继续读取
+async def get_jmx_metrics(session, url, keys, timeout):
+    # noinspection PyBroadException
+    try:
+        projector = jsonStream.JsonProjector(keys)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async with session.get(url, timeout=timeout) as resp:
+            if resp.status // 100 != 2:
+                return [resp.status, None]
+            async for chunk in resp.content.iter_chunked(JMX_CHUNK_SIZE):
+                if projector.feed(decoder.decode(chunk)):
+                    break
+            else:
+                projector.feed(decoder.decode(b"", final=True), final=True)
+            return [resp.status, projector.values]
+    except Exception as e:
+        print(f"{time.time()} getJmxInfo Func get_jmx_metrics() Error Message: {e}")
+
+
+async def get_jmx_info(jmx_prefix, con_id, session, cons_info, semaphore, jmx_metrics, deadline):
     url = f"{jmx_prefix}/admin/metrics"
-    jmx_info = await async_http(session=session, url=url, method='get')
-    if jmx_info[0] // 100 == 2:
-        jmx_info_json = json.loads(jmx_info[1])
-        cons_info[con_id].update({
-            "@timestamp": time.time() * 1000,
-            "Maximum_Heap": int(format(float(jmx_info_json['heap']), '0.0f')),
-            "Heap_Used": int(format(float(jmx_info_json['heap.used']), '0.0f')),
-            "Non-Heap": int(format(float(jmx_info_json['nonheap']), '0.0f')),
-            "Threads": int(format(float(jmx_info_json['threads']), '0.0f'))
-        })
+    async with semaphore:
+        start_time = time.time()
+        # 排队到截止时间仍未开始的不再请求，按未完成处理
+        if start_time >= deadline:
+            return False
+        jmx_info = await get_jmx_metrics(session=session, url=url, keys=jmx_metrics.values(),
+                                         timeout=jmx_timeout(jmx_prefix, deadline - start_time))
+        cost_time = time.time() - start_time
+        metrics.observe_stage("getJmxInfo", "jmx_scrape", cost_time)
+    if jmx_info is None:
+        # 超时或连接失败时按读超时上限记一次耗时，下次给足时间
+        jmx_latency[jmx_prefix] = JMX_READ_TIMEOUT_MAX
+    elif jmx_info[0] // 100 == 2:
+        latency = jmx_latency.get(jmx_prefix)
+        jmx_latency[jmx_prefix] = cost_time if latency is None else latency * 0.7 + cost_time * 0.3
+        cons_info[con_id].update({"@timestamp": time.time() * 1000})
+        for field, key in jmx_metrics.items():
+            if key in jmx_info[1]:
+                cons_info[con_id][field] = int(format(float(jmx_info[1][key]), '0.0f'))
         del cons_info[con_id]['jmx_prefix']
 
 
-async def push_data(env_name, session, raw_data):
+# 在截止时间内并发采集，返回未按时完成的容器
+async def scrape_jmx(session, cons_info, jmx_metrics):
+    semaphore = asyncio.Semaphore(JMX_CONCURRENCY)
+    deadline = time.time() + JMX_DEADLINE
+    tasks = {asyncio.ensure_future(get_jmx_info(jmx_prefix=cons_info[con_id]['jmx_prefix'],
+                                                con_id=con_id,
+                                                session=session,
+                                                cons_info=cons_info,
+                                                semaphore=semaphore,
+                                                jmx_metrics=jmx_metrics,
+                                                deadline=deadline)): con_id for con_id in cons_info.keys()}
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks.keys(), timeout=JMX_DEADLINE + JMX_DEADLINE_GRACE)
+    for task in pending:
+        task.cancel()
+    return [con_id for task, con_id in tasks.items()
+            if task in pending or (task.exception() is None and task.result() is False)]
+
+
+async def push_data(env_name, session, raw_data, sink=None, mapping=ES_MAPPING):
     def _es_index_name():
         return f"service_jvm-{env_name}-{time.strftime('%Y.%m.%d', time.localtime())}"
 
+    # 索引及模板由esIndex统一管理，已知存在时不再发送HEAD
     async def check_index_mapping():
-        # 查看索引状态
-        async def is_index():
-            return await async_http(session=session, method='head', url=f"{ES_URL}/{_es_index_name()}")
-
-        # 创建索引
-        async def create_index():
-            return await async_http(session=session, url=f"{ES_URL}/{_es_index_name()}",
-                                    method='put', data=json.dumps(ES_MAPPING), headers=ELK_MAPPING_HEADERS)
-
         # noinspection PyBroadException
         try:
-            index_status = await is_index()
-            if index_status[0] // 100 != 2:
-                return await create_index()
-            else:
-                return [index_status[0], "Index 'marathon' is already exists."]
+            return await esIndex.get_lifecycle().ensure(session, esBulk.ES_URL, _es_index_name(), mapping)
         except Exception as e:
             print(f"{time.time()} getJmx {env_name} Func es_index() Error Message: {e}")
 
     def _init_es_data():
         if isinstance(raw_data, dict):
-            result = ""
-            es_header = '{"index": {"_index": ' + '"{}", '.format(_es_index_name()) + '"_type": "doc"}}\n'
-            for i in raw_data.values():
-                result = result + es_header + f'{json.dumps(i)}\n'
-            return [len(raw_data), result]
+            index_name = _es_index_name()
+            return [len(raw_data), ((index_name, i) for i in raw_data.values())]
         else:
             return [0, None]
 
-    await check_index_mapping()
     write_data = _init_es_data()
+    # 提交给进程内的esSink，由其合并写入
+    if sink is not None:
+        if write_data[0] > 0:
+            return [await sink.submit(_es_index_name(), (x[1] for x in write_data[1]), mapping),
+                    [202, {"errors": False, "queued": True}]]
+        return None
+    await check_index_mapping()
     if write_data[0] > 0:
-        run_push = await async_http(session=session, url=f'{ES_URL}/_bulk', method='post',
-                                    data=write_data[1], headers=ELK_BULK_HEADERS)
-        return [write_data[0], run_push]
-
-
-async def run(env_name):
-    host_info = get_hostname_ip()
-    docker_prefix = f"http://{host_info[0]}:2375"
-    async with aiohttp.ClientSession() as s:
-        await asyncio.ensure_future(get_cons_list(docker_prefix=docker_prefix, session=s))
-        await asyncio.wait([asyncio.ensure_future(get_cons_info(docker_prefix=docker_prefix,
-                                                                con_id=x,
-                                                                session=s,
-                                                                host_info=host_info)) for x in cons_info.keys()])
-        await asyncio.wait([asyncio.ensure_future(get_jmx_info(jmx_prefix=cons_info[con_id]['jmx_prefix'],
-                                                               con_id=con_id,
-                                                               session=s)) for con_id in cons_info.keys()])
-        push_result = await asyncio.ensure_future(push_data(env_name=env_name, session=s, raw_data=cons_info))
+        encoder = esBulk.BulkEncoder()
+        results = []
+        for batch in encoder.batches(write_data[1]):
+            with metrics.stage("getJmxInfo", "bulk_push"):
+                result = await async_http(session=session, url=f'{esBulk.ES_URL}/_bulk', method='post',
+                                          data=encoder.body(batch), headers=encoder.headers(),
+                                          timeout=esBulk.BULK_TIMEOUT)
+            esSpool.get_spool().spool_failed(batch, result)
+            results.append(result)
+        metrics.observe_stage("getJmxInfo", "bulk_encode", encoder.encode_seconds)
+        return [write_data[0], esBulk.merge_results(results)]
+
+
+async def run(env_name, session=None, sink=None, jmx_metrics=None, rollup_seconds=0,
+              deadband=changeFilter.CHANGE_DEADBAND, heartbeat_seconds=changeFilter.CHANGE_HEARTBEAT_SECONDS):
+    jmx_metrics = jmx_metrics or JMX_METRICS
+    host_info = hostInfo.get_host_info()
+    docker_prefix = hostInfo.docker_prefix()
+    cons_info = {}
+    meta_cache = dockerMeta.get_cache()
+    async with session_scope(session) as s, hostInfo.docker_session_scope(session) as docker_session:
+        if session is not None:
+            meta_cache.watch(docker_prefix, docker_session)
+        snapshot = await dockerDiscovery.get_discovery().snapshot(docker_prefix, docker_session)
+        get_cons_info(snapshot=snapshot, host_info=host_info, cons_info=cons_info)
+        stragglers = await scrape_jmx(s, cons_info, jmx_metrics)
+        if stragglers:
+            print(f"{time.time()} getJmxInfo Stragglers: {[cons_info[x]['host_port'] for x in stragglers]}")
+        # 只推送按时拿到Jmx数据的容器
+        cons_info = {k: v for k, v in cons_info.items() if "@timestamp" in v}
+        mapping = es_mapping(jmx_metrics)
+        if rollup_seconds:
+            count = len(cons_info)
+            cons_info = sampleStore.get_store().sample(f"service_jvm-{env_name}", cons_info, jmx_metrics.keys(),
+                                                       rollup_seconds)
+            if cons_info is None:
+                return [count, [200, {"errors": False, "sampled": True}]]
+            mapping = sampleStore.rollup_mapping(mapping, jmx_metrics.keys())
+        if cons_info and deadband is not None:
+            count = len(cons_info)
+            cons_info = changeFilter.get_filter().filter(f"service_jvm-{env_name}", cons_info, deadband,
+                                                         heartbeat_seconds, CHANGE_IGNORE_FIELDS)
+            if not cons_info:
+                return [count, [200, {"errors": False, "unchanged": True}]]
+        push_result = await asyncio.ensure_future(push_data(env_name=env_name, session=s, raw_data=cons_info,
+                                                            sink=sink, mapping=mapping))
+        if deadband is not None and changeFilter.push_succeeded(push_result):
+            changeFilter.get_filter().commit(f"service_jvm-{env_name}", cons_info, CHANGE_IGNORE_FIELDS)
     return push_result
 
 
+def format_result(task_result):
+    if task_result is not None:
+        # ES不可达时bulk请求没有响应
+        if task_result[1] is None:
+            return f"{time.time()} getJmxInfo Push failed. [No Response]"
+        if task_result[1][0] // 100 == 2:
+            if task_result[1][1].get('sampled'):
+                return f"{time.time()} getJmxInfo Sampled. [{task_result[0]}]"
+            if task_result[1][1].get('unchanged'):
+                return f"{time.time()} getJmxInfo Unchanged. [{task_result[0]}]"
+            if task_result[1][1].get('queued'):
+                return f"{time.time()} getJmxInfo Queued. [{task_result[0]}]"
+            if task_result[1][1]['errors']:
+                return f"{time.time()} getJmxInfo Push failed. [{task_result[0]}]"
+            else:
+                return f"{time.time()} getJmxInfo Push success. [{task_result[0]}]"
+        else:
+            return f"{time.time()} getJmxInfo Push failed. [Http Error Code({task_result[1][0]})]"
+    else:
+        return f"{time.time()} getJmxInfo No Data to Push."
+
+
 if __name__ == '__main__':
-    cons_info = {}
     if (len(sys.argv) - 1) != 1 or sys.argv[1] not in ["pro", "uat", "perf", "sit"]:
         print(f"{time.time()} getJmxInfo parameter Error.")
     else:
@@ -231,17 +344,6 @@ if __name__ == '__main__':
             loop = asyncio.get_event_loop()
             task = asyncio.ensure_future(run(env_name="sit"))
             loop.run_until_complete(task)
-            task_result = task.result()
-            if task_result is not None:
-                if task_result[1][0] // 100 == 2:
-                    if task_result[1][1]['errors']:
-                        print(f"{time.time()} getJmxInfo Push failed. [{task_result[0]}]")
-                    else:
-                        print(f"{time.time()} getJmxInfo Push success. [{task_result[0]}]")
-                else:
-                    print(f"{time.time()} getJmxInfo Push failed. [Http Error Code({task_result[1][0]})]")
-            else:
-                print(f"{time.time()} getJmxInfo No Data to Push.")
+            print(format_result(task.result()))
         except Exception as er:
             print(f"{time.time()} getJmxInfo Error {er}")
-
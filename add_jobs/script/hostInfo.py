@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、本机IP及主机名每个进程只解析一次，可通过环境变量HOST_IP、HOST_NAME覆盖
+2、Docker API地址由DOCKER_HOST决定: unix:///var/run/docker.sock走unix socket(aiohttp UnixConnector)，
+   tcp://host:port或http://host:port走TCP；未设置时本机docker.sock可读写则用unix socket，否则用http://{本机IP}:2375
+3、unix socket方式下进程内共用一个Docker Session，命令行方式运行时临时建立并在结束时关闭
+4、aiohttp在首次建立连接时才导入
+"""
+
+import os
+import socket
+import contextlib
+from httpPool import session_scope
+
+HOST_IP = os.environ.get("HOST_IP", "")
+HOST_NAME = os.environ.get("HOST_NAME", "")
+DOCKER_HOST = os.environ.get("DOCKER_HOST", "")
+DOCKER_SOCKET = "/var/run/docker.sock"
+DOCKER_PORT = 2375
+
+_host_info = None
+_docker_session = None
+
+
+def resolve_host_ip():
+    sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # UDP connect不发送数据，只用于确定出口网卡的地址
+        sk.connect(('8.8.8.8', 80))
+        return sk.getsockname()[0]
+    except OSError:
+        return socket.gethostbyname(socket.gethostname())
+    finally:
+        sk.close()
+
+
+def get_host_info():
+    global _host_info
+    if _host_info is None:
+        _host_info = [HOST_IP or resolve_host_ip(), HOST_NAME or socket.gethostname()]
+    return _host_info
+
+
+def docker_socket():
+    if DOCKER_HOST.startswith("unix://"):
+        return DOCKER_HOST[len("unix://"):]
+    if not DOCKER_HOST and os.access(DOCKER_SOCKET, os.R_OK | os.W_OK):
+        return DOCKER_SOCKET
+    return None
+
+
+# unix socket方式下URL中的主机名不生效，仅用于拼接路径
+def docker_prefix():
+    if docker_socket() is not None:
+        return "http://docker"
+    if DOCKER_HOST.startswith("tcp://"):
+        return "http://" + DOCKER_HOST[len("tcp://"):]
+    if DOCKER_HOST:
+        return DOCKER_HOST.rstrip("/")
+    return "http://{}:{}".format(get_host_info()[0], DOCKER_PORT)
+
+
+def docker_connector(**kwargs):
+    import aiohttp
+    path = docker_socket()
+    if path is not None:
+        return aiohttp.UnixConnector(path=path, **kwargs)
+    return aiohttp.TCPConnector(**kwargs)
+
+
+def get_docker_session():
+    global _docker_session
+    if _docker_session is None or _docker_session.closed:
+        import aiohttp
+        _docker_session = aiohttp.ClientSession(connector=docker_connector())
+    return _docker_session
+
+
+# 访问Docker API所用的Session: TCP方式与session_scope相同，unix socket方式改用UnixConnector的Session
+@contextlib.asynccontextmanager
+async def docker_session_scope(session=None):
+    if docker_socket() is None:
+        async with session_scope(session) as s:
+            yield s
+    elif session is not None:
+        yield get_docker_session()
+    else:
+        import aiohttp
+        async with aiohttp.ClientSession(connector=docker_connector()) as s:
+            yield s
+
+
+async def close():
+    if _docker_session is not None and not _docker_session.closed:
+        await _docker_session.close()
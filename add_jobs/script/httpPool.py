@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、进程内共享的aiohttp长连接池，python类型的Job跨周期复用，保留Docker API/JMX/ES的keep-alive连接
+2、按Host限制连接数，开启DNS缓存，统一HTTP超时
+3、通过TraceConfig统计连接复用(hit)和新建连接(miss)次数
+4、aiohttp在首次创建Session时才导入，只运行shell类型Job的entrypoint不承担其导入耗时
+"""
+
+import os
+import contextlib
+
+POOL_LIMIT = int(os.environ.get("POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.environ.get("POOL_LIMIT_PER_HOST", 10))
+POOL_KEEPALIVE = float(os.environ.get("POOL_KEEPALIVE", 60))
+POOL_DNS_TTL = int(os.environ.get("POOL_DNS_TTL", 300))
+POOL_TIMEOUT = float(os.environ.get("POOL_TIMEOUT", 15))
+
+
+class SessionPool(object):
+
+    def __init__(self, limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST, keepalive_timeout=POOL_KEEPALIVE,
+                 dns_ttl=POOL_DNS_TTL, timeout=POOL_TIMEOUT):
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._dns_ttl = dns_ttl
+        self._timeout = timeout
+        self._session = None
+        self._stats = {"hit": 0, "miss": 0, "dns_hit": 0, "dns_miss": 0}
+
+    def _trace_config(self):
+        import aiohttp
+
+        def counter(key):
+            async def on_signal(session, trace_config_ctx, params):
+                self._stats[key] += 1
+            return on_signal
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_reuseconn.append(counter("hit"))
+        trace_config.on_connection_create_end.append(counter("miss"))
+        trace_config.on_dns_cache_hit.append(counter("dns_hit"))
+        trace_config.on_dns_cache_miss.append(counter("dns_miss"))
+        return trace_config
+
+    # 首次使用时在当前事件循环内创建Session
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self._limit,
+                                             limit_per_host=self._limit_per_host,
+                                             keepalive_timeout=self._keepalive_timeout,
+                                             use_dns_cache=True,
+                                             ttl_dns_cache=self._dns_ttl)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout),
+                                                  trace_configs=[self._trace_config()])
+        return self._session
+
+    def stats(self):
+        result = dict(self._stats)
+        total = result['hit'] + result['miss']
+        result['hit_rate'] = float(format(result['hit'] / total, '0.4f')) if total > 0 else 0.0
+        return result
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = SessionPool()
+    return _pool
+
+
+# 传入共享Session时直接复用，否则(命令行方式运行)临时建立并在结束时关闭
+@contextlib.asynccontextmanager
+async def session_scope(session=None):
+    if session is not None:
+        yield session
+    else:
+        import aiohttp
+        async with aiohttp.ClientSession() as s:
+            yield s
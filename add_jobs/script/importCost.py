@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、测量Job模块的导入耗时: 在新的解释器子进程中以-X importtime导入，与命令行方式每次运行的冷启动开销一致
+2、shell类型的Job从job_command中找出/script下的脚本名，python类型的Job取job_module
+3、entrypoint启动后在后台为每个Job测量一次并打印耗时最多的直接依赖，IMPORT_COST_REPORT=0关闭
+4、可单独运行: python importCost.py getDockerInfo getJmxInfo
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+
+IMPORT_COST_REPORT = os.environ.get("IMPORT_COST_REPORT", "1") == "1"
+IMPORT_COST_TOP = 3
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_TIME_REGEX = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def job_module(job):
+    if job.get('job_type') == "python":
+        return job['job_module']
+    for name in re.findall(r"(\w+)\.py\b", job['job_command']):
+        if os.path.isfile(os.path.join(SCRIPT_DIR, name + ".py")):
+            return name
+    return None
+
+
+# 返回模块的累计导入耗时(秒)及其直接依赖中耗时最多的几项[(模块名, 秒)]
+def parse_import_time(text, module):
+    children = []
+    for line in text.splitlines():
+        match = IMPORT_TIME_REGEX.match(line)
+        if match is None:
+            continue
+        cumulative, depth, name = int(match.group(2)) / 1e6, len(match.group(3)) // 2, match.group(4)
+        if depth == 0:
+            if name == module:
+                children.sort(key=lambda x: x[1], reverse=True)
+                return cumulative, children[:IMPORT_COST_TOP]
+            children = []
+        elif depth == 1:
+            children.append((name, cumulative))
+    return None
+
+
+async def measure(module, cwd=SCRIPT_DIR):
+    try:
+        proc = await asyncio.create_subprocess_exec(sys.executable, "-X", "importtime", "-c",
+                                                    "import {}".format(module), cwd=cwd,
+                                                    stdout=asyncio.subprocess.DEVNULL,
+                                                    stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            return None
+        return parse_import_time(stderr.decode(errors="replace"), module)
+    except Exception as e:
+        print("{} importCost Func measure() {} Error Message: {}".format(time.time(), module, e))
+
+
+def format_cost(module, cost):
+    if cost is None:
+        return "{} import failed".format(module)
+    return "{} import {:.1f}ms ({})".format(module, cost[0] * 1000,
+                                            ", ".join("{} {:.1f}ms".format(x[0], x[1] * 1000) for x in cost[1]))
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    for name in sys.argv[1:]:
+        print(format_cost(name, loop.run_until_complete(measure(name))))
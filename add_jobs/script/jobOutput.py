@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、Job的stdout/stderr按行读取，每个流只保留最近JOB_OUTPUT_MAX_BYTES字节(环形缓冲)，超出部分从最旧的行开始丢弃并计数
+2、超过StreamReader上限的超长行整行丢弃并按实际字节数计数，不会一次读入内存
+3、执行结果按JOB_LOG_FORMAT输出: text为原有单行格式，json为一行一条的JSON记录(包含job、run_id、退出码及耗时)
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import collections
+
+JOB_OUTPUT_MAX_BYTES = int(os.environ.get("JOB_OUTPUT_MAX_BYTES", 64 * 1024))
+JOB_LOG_FORMAT = os.environ.get("JOB_LOG_FORMAT", "text")
+
+
+class OutputBuffer(object):
+
+    def __init__(self, max_bytes=JOB_OUTPUT_MAX_BYTES):
+        self._max_bytes = max_bytes
+        self._lines = collections.deque()
+        self._bytes = 0
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+
+    def append(self, line):
+        size = len(line.encode(errors="replace"))
+        self._lines.append((line, size))
+        self._bytes += size
+        while self._bytes > self._max_bytes and self._lines:
+            _, dropped = self._lines.popleft()
+            self._bytes -= dropped
+            self.dropped_lines += 1
+            self.dropped_bytes += dropped
+
+    def drop(self, size):
+        self.dropped_lines += 1
+        self.dropped_bytes += size
+
+    @property
+    def lines(self):
+        return [x[0] for x in self._lines]
+
+    def __repr__(self):
+        if self.dropped_lines:
+            return "{} (dropped {} lines, {} bytes)".format(self.lines, self.dropped_lines, self.dropped_bytes)
+        return "{}".format(self.lines)
+
+
+# 子进程管道的StreamReader以JOB_OUTPUT_MAX_BYTES为上限创建，超长行分段读出并丢弃到下一个换行为止，按实际字节数计数
+async def read_stream(stream, output):
+    dropped = None
+    while True:
+        try:
+            line = await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            chunk = await stream.readexactly(e.consumed)
+            dropped = (dropped or 0) + len(chunk)
+            continue
+        if dropped is not None:
+            output.drop(dropped + len(line.rstrip(b"\n")))
+            dropped = None
+        elif line:
+            output.append(line.decode(errors="replace").rstrip("\n"))
+        if not line.endswith(b"\n"):
+            break
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:16]
+
+
+def format_run(job, run_id, start_time, exit_code, cost_time, messages, errors, log_format=JOB_LOG_FORMAT):
+    if log_format == "json":
+        return json.dumps({"time": start_time,
+                           "job": job['job_name'],
+                           "run_id": run_id,
+                           "command": job['job_command'],
+                           "exit_code": exit_code,
+                           "cost_time": round(cost_time, 3),
+                           "stdout": messages.lines,
+                           "stderr": errors.lines,
+                           "stdout_dropped_lines": messages.dropped_lines,
+                           "stderr_dropped_lines": errors.dropped_lines}, ensure_ascii=False)
+    return "[{time}] [{name}: {command}] {messages} Errors: {errors} ExitCode: {code} CostTime: {cost}s".format(
+        time=start_time,
+        name=job['job_name'],
+        command=job['job_command'],
+        messages=messages,
+        errors=errors,
+        code=exit_code,
+        cost=format(cost_time, '0.3f'))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、从JOB_FILE(文件或目录)读取Job定义，格式与环境变量JOB_n相同，文件内可以是单个Job或Job列表，目录下读取所有*.json文件
+2、每JOB_RELOAD_INTERVAL秒检查文件列表、修改时间及大小，有变化时重新读取并交给entrypoint与调度器中的Job比较
+3、文件不可读或JSON有误时打印错误并保持当前Job不变，下次文件变化时再重新读取
+"""
+
+import os
+import json
+import time
+import asyncio
+
+JOB_FILE = os.environ.get("JOB_FILE", "")
+JOB_RELOAD_INTERVAL = float(os.environ.get("JOB_RELOAD_INTERVAL", 5))
+
+
+def job_files(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, x) for x in os.listdir(path) if x.endswith(".json"))
+    return [path]
+
+
+def fingerprint(path):
+    result = []
+    for file_path in job_files(path):
+        try:
+            stat = os.stat(file_path)
+            result.append((file_path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            result.append((file_path, None, None))
+    return result
+
+
+def read_jobs(path):
+    jobs = []
+    for file_path in job_files(path):
+        with open(file_path) as f:
+            job_json = json.load(f)
+        jobs.extend(job_json if isinstance(job_json, list) else [job_json])
+    return jobs
+
+
+async def watch(path, on_change, interval=JOB_RELOAD_INTERVAL):
+    last = fingerprint(path)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = fingerprint(path)
+            if current == last:
+                continue
+            last = current
+            on_change(read_jobs(path))
+        except Exception as e:
+            print("{} jobReload Func watch() {} Error Message: {}".format(time.time(), path, e))
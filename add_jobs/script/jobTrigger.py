@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、根据Job的job_trigger配置生成APScheduler触发器
+2、支持间隔触发(weeks/days/hours/minutes/seconds)及crontab表达式触发(cron)
+3、phase: 按主机名哈希得到固定的相位偏移，同一镜像的各主机在周期内均匀错开；也可直接指定偏移秒数
+4、jitter: 每次触发再叠加有界的随机抖动(秒)
+5、adaptive: 自适应间隔，根据Job最近的耗时、主机负载及失败率在上下限内拉长间隔，恢复后逐步缩短
+"""
+
+import os
+import socket
+import zlib
+import datetime
+import collections
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# 计算相位偏移所用的Key，默认主机名
+JOB_PHASE_KEY = os.environ.get("JOB_PHASE_KEY", "") or socket.gethostname()
+CRON_PHASE_WINDOW = 60
+ADAPTIVE_UNSUPPORTED_KEYS = ("phase", "phase_group", "start_date", "end_date", "timezone")
+adaptive_triggers = {}
+
+
+# 同一主机、同一Job的偏移固定，不随进程重启变化
+def phase_offset(job_name, period, key=JOB_PHASE_KEY):
+    if period <= 0:
+        return 0
+    return zlib.crc32("{}/{}".format(key, job_name).encode()) / 2 ** 32 * period
+
+
+# phase_group相同的Job使用同一偏移，同时触发(如getDockerInfo与getJmxInfo共用一次容器发现)
+def get_phase(job_name, job_trigger, period):
+    phase = job_trigger.get("phase", False)
+    if phase is True or phase == "hostname":
+        return phase_offset(job_trigger.get("phase_group", job_name), period)
+    return float(phase or 0) % period if period > 0 else 0
+
+
+def host_load():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+class AdaptiveTrigger(BaseTrigger):
+    # 有压力时间隔翻倍，压力消除后每次缩短到0.75倍
+    BACKOFF_FACTOR = 2.0
+    RECOVER_FACTOR = 0.75
+
+    def __init__(self, seconds, min_seconds=None, max_seconds=None, max_load=1.0, max_cost=0.5,
+                 max_failure_rate=0.2, window=5, jitter=None):
+        # 间隔为0时APScheduler计算错过的触发时间会陷入死循环
+        if seconds <= 0:
+            raise ValueError("adaptive trigger requires a positive interval")
+        self.min_seconds = float(min_seconds or seconds)
+        self.max_seconds = float(max_seconds or self.min_seconds * 10)
+        if self.min_seconds <= 0 or self.min_seconds > self.max_seconds:
+            raise ValueError("adaptive trigger requires 0 < min_seconds <= max_seconds, got {:g}-{:g}".format(
+                self.min_seconds, self.max_seconds))
+        self.interval = min(max(float(seconds), self.min_seconds), self.max_seconds)
+        self.max_load = max_load
+        self.max_cost = max_cost
+        self.max_failure_rate = max_failure_rate
+        self.jitter = jitter
+        self._runs = collections.deque(maxlen=window)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        base = previous_fire_time if previous_fire_time is not None else now
+        next_fire_time = base + datetime.timedelta(seconds=self.interval)
+        return self._apply_jitter(next_fire_time, self.jitter, now)
+
+    def cost(self):
+        return sum(x[0] for x in self._runs) / len(self._runs) if self._runs else 0.0
+
+    def pressure(self):
+        if not self._runs:
+            return None
+        cost = self.cost()
+        failure_rate = sum(1 for x in self._runs if x[1]) / len(self._runs)
+        load = host_load()
+        if cost > self.max_cost * self.interval:
+            return "cost {:.3f}s".format(cost)
+        if load > self.max_load:
+            return "load {:.2f}".format(load)
+        if failure_rate > self.max_failure_rate:
+            return "failure rate {:.2f}".format(failure_rate)
+        return None
+
+    # 每次执行结束后记录耗时及是否失败，并重新计算间隔
+    def record(self, cost, failed):
+        self._runs.append((cost, failed))
+        reason = self.pressure()
+        if reason is not None:
+            self.interval = min(self.interval * self.BACKOFF_FACTOR, self.max_seconds)
+        else:
+            # 缩短后耗时仍在阈值内才缩短，避免在两个间隔之间来回振荡
+            interval = max(self.interval * self.RECOVER_FACTOR, self.min_seconds)
+            if self.cost() <= self.max_cost * interval:
+                self.interval = interval
+        return reason
+
+    def __str__(self):
+        return "adaptive[{:g}s, {:g}-{:g}s]".format(self.interval, self.min_seconds, self.max_seconds)
+
+
+def build_trigger(job_name, job_trigger):
+    jitter = job_trigger.get("jitter", None)
+    timezone = job_trigger.get("timezone", None)
+    if "adaptive" in job_trigger:
+        # 自适应触发器按上次触发时间累加间隔，不支持相位、起止时间及时区
+        unsupported = [x for x in ADAPTIVE_UNSUPPORTED_KEYS if x in job_trigger]
+        if unsupported:
+            raise ValueError("adaptive trigger does not support {}".format(", ".join(unsupported)))
+        adaptive = job_trigger["adaptive"]
+        if not isinstance(adaptive, dict):
+            raise ValueError("adaptive must be an object, got {!r}".format(adaptive))
+        seconds = datetime.timedelta(weeks=job_trigger.get("weeks", 0),
+                                     days=job_trigger.get("days", 0),
+                                     hours=job_trigger.get("hours", 0),
+                                     minutes=job_trigger.get("minutes", 0),
+                                     seconds=job_trigger.get("seconds", 0)).total_seconds()
+        trigger = AdaptiveTrigger(seconds,
+                                  min_seconds=adaptive.get("min_seconds", None),
+                                  max_seconds=adaptive.get("max_seconds", None),
+                                  max_load=adaptive.get("max_load", 1.0),
+                                  max_cost=adaptive.get("max_cost", 0.5),
+                                  max_failure_rate=adaptive.get("max_failure_rate", 0.2),
+                                  window=adaptive.get("window", 5),
+                                  jitter=jitter)
+        adaptive_triggers[job_name] = trigger
+        return trigger
+    if "cron" in job_trigger:
+        values = job_trigger["cron"].split()
+        if len(values) != 5:
+            raise ValueError("Wrong number of cron fields; got {}, expected 5".format(len(values)))
+        # crontab最小粒度为分钟，相位偏移落在每分钟的秒字段上
+        return CronTrigger(minute=values[0], hour=values[1], day=values[2], month=values[3], day_of_week=values[4],
+                           second=int(get_phase(job_name, job_trigger, CRON_PHASE_WINDOW)),
+                           start_date=job_trigger.get("start_date", None),
+                           end_date=job_trigger.get("end_date", None),
+                           timezone=timezone,
+                           jitter=jitter)
+    trigger = IntervalTrigger(weeks=job_trigger.get("weeks", 0),
+                              days=job_trigger.get("days", 0),
+                              hours=job_trigger.get("hours", 0),
+                              minutes=job_trigger.get("minutes", 0),
+                              seconds=job_trigger.get("seconds", 0),
+                              start_date=job_trigger.get("start_date", None),
+                              end_date=job_trigger.get("end_date", None),
+                              timezone=timezone,
+                              jitter=jitter)
+    if job_trigger.get("phase", False):
+        # 未指定start_date时以Unix纪元为起点，触发时间对齐到周期内的固定位置
+        offset = datetime.timedelta(seconds=get_phase(job_name, job_trigger, trigger.interval_length))
+        if job_trigger.get("start_date", None) is None:
+            trigger.start_date = datetime.datetime.fromtimestamp(0, datetime.timezone.utc).astimezone(trigger.timezone)
+        trigger.start_date += offset
+    return trigger
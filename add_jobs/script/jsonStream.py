@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、增量解析顶层JSON对象，只提取指定的Key，其它值(包括嵌套对象/数组)只扫描跳过不构造
+2、分块喂入数据，所需Key全部拿到后即可停止读取响应体
+"""
+
+import re
+import json
+
+WHITESPACE = re.compile(r'\s*')
+NESTED_TOKEN = re.compile(r'["{}\[\]]')
+STRING_TOKEN = re.compile(r'["\\]')
+SCALAR_END = re.compile(r'[\s,}\]]')
+
+
+class JsonProjector(object):
+
+    def __init__(self, keys):
+        self._keys = set(keys)
+        self.values = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        # 跳过嵌套值时的状态: [深度, 是否在字符串内]
+        self._skip = None
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk, final=False):
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        while not self.done and self._step(final):
+            pass
+        return self.done
+
+    def _skip_ws(self):
+        self._pos = WHITESPACE.match(self._buf, self._pos).end()
+        return self._pos < len(self._buf)
+
+    def _step(self, final):
+        if self._skip is not None:
+            return self._skip_nested()
+        if not self._skip_ws():
+            return False
+        char = self._buf[self._pos]
+        if self._state == "start":
+            if char != "{":
+                raise ValueError("Expecting '{{' at {}".format(self._pos))
+            self._pos += 1
+            self._state = "key"
+        elif self._state == "key":
+            if char == "}":
+                self.done = True
+                return False
+            try:
+                self._key, self._pos = json.decoder.scanstring(self._buf, self._pos + 1)
+            except json.JSONDecodeError:
+                return False
+            self._state = "colon"
+        elif self._state == "colon":
+            self._pos += 1
+            self._state = "value"
+        elif self._state == "value":
+            if self._key in self._keys:
+                # 数字等标量可能被分块截断，没看到结束符时等待更多数据
+                if char not in '{["' and SCALAR_END.search(self._buf, self._pos) is None and not final:
+                    return False
+                try:
+                    value, end = self._decoder.raw_decode(self._buf, self._pos)
+                except json.JSONDecodeError:
+                    return False
+                self.values[self._key] = value
+                self._pos = end
+                if len(self.values) == len(self._keys):
+                    self.done = True
+                    return False
+            elif char in "{[":
+                self._skip = [1, False]
+                self._pos += 1
+            elif char == '"':
+                self._skip = [0, True]
+                self._pos += 1
+            else:
+                match = SCALAR_END.search(self._buf, self._pos)
+                if match is None:
+                    return False
+                self._pos = match.start()
+            self._state = "comma"
+        elif self._state == "comma":
+            self._pos += 1
+            if char == "}":
+                self.done = True
+                return False
+            self._state = "key"
+        return True
+
+    def _skip_nested(self):
+        while True:
+            in_string = self._skip[1]
+            pattern = STRING_TOKEN if in_string else NESTED_TOKEN
+            match = pattern.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                return False
+            token = match.group()
+            if in_string:
+                if token == "\\":
+                    if match.end() >= len(self._buf):
+                        self._pos = match.start()
+                        return False
+                    self._pos = match.end() + 1
+                    continue
+                self._skip[1] = False
+            elif token == '"':
+                self._skip[1] = True
+            elif token in "{[":
+                self._skip[0] += 1
+            else:
+                self._skip[0] -= 1
+            self._pos = match.end()
+            if self._skip[0] == 0 and not self._skip[1]:
+                self._skip = None
+                return True
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、进程内指标注册表(Counter/Gauge/Histogram)，按Prometheus文本格式输出
+2、entrypoint启动本地HTTP端点(METRICS_PORT)供Prometheus抓取
+3、采集脚本通过stage()上报各阶段耗时: Docker列表、inspect、stats、Jmx采集、bulk编码、bulk推送
+4、定时测量调度器事件循环延迟
+"""
+
+import os
+import time
+import asyncio
+import contextlib
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+LOOP_LAG_INTERVAL = 0.5
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+             for k, v in zip(label_names, label_values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    return "{{{}}}".format(",".join(pairs)) if pairs else ""
+
+
+class Counter(object):
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        for label_values, value in self._values.items():
+            yield "{}{} {}".format(self.name, _format_labels(self.label_names, label_values), value)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(object):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        if label_values not in self._values:
+            self._values[label_values] = [[0] * len(self._buckets), 0.0, 0]
+        counts = self._values[label_values]
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                counts[0][i] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    def render(self):
+        for label_values, (buckets, total, count) in self._values.items():
+            for bound, bucket_count in zip(self._buckets, buckets):
+                yield "{}_bucket{} {}".format(self.name, _format_labels(self.label_names, label_values, ("le", bound)),
+                                              bucket_count)
+            yield "{}_bucket{} {}".format(self.name, _format_labels(self.label_names, label_values, ("le", "+Inf")),
+                                          count)
+            yield "{}_sum{} {}".format(self.name, _format_labels(self.label_names, label_values), total)
+            yield "{}_count{} {}".format(self.name, _format_labels(self.label_names, label_values), count)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._metrics = {}
+        self._stats = {}
+
+    def _register(self, metric):
+        if metric.name not in self._metrics:
+            self._metrics[metric.name] = metric
+        return self._metrics[metric.name]
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    # 各组件的stats()字典按gauge输出，例如http_pool{stat="hit"}
+    def register_stats(self, name, documentation, stats_func):
+        self._stats[name] = (documentation, stats_func)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            lines.extend(metric.render())
+        for name, (documentation, stats_func) in self._stats.items():
+            lines.append("# HELP {} {}".format(name, documentation))
+            lines.append("# TYPE {} gauge".format(name))
+            for key, value in stats_func().items():
+                lines.append('{}{{stat="{}"}} {}'.format(name, key, value))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("collector_stage_seconds", "Collector stage duration in seconds.",
+                                   ("collector", "stage"))
+LOOP_LAG_SECONDS = REGISTRY.gauge("event_loop_lag_seconds", "Scheduler event loop lag in seconds.")
+LOOP_LAG_HISTOGRAM = REGISTRY.histogram("event_loop_lag_histogram_seconds", "Scheduler event loop lag in seconds.")
+
+
+@contextlib.contextmanager
+def stage(collector, name):
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.time() - start_time, collector, name)
+
+
+def observe_stage(collector, name, seconds):
+    STAGE_SECONDS.observe(seconds, collector, name)
+
+
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    loop = asyncio.get_event_loop()
+    while True:
+        start_time = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start_time - interval, 0.0)
+        LOOP_LAG_SECONDS.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        path = request_line.decode(errors="replace").split(" ")[1] if request_line.count(b" ") >= 2 else "/"
+        if path.split("?")[0] in ("/", "/metrics"):
+            status, body = "200 OK", REGISTRY.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write("HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, len(body)).encode() + body)
+        await writer.drain()
+    except Exception as e:
+        print("{} metrics Func _handle() Error Message: {}".format(time.time(), e))
+    finally:
+        writer.close()
+
+
+async def serve(host=METRICS_HOST, port=METRICS_PORT):
+    return await asyncio.start_server(_handle, host, port)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、进程内的样本存储，按(索引前缀, 容器)保存一组array('d')列: 时间戳及每个指标一列，不再为每个样本保留一份dict
+2、采集Job可高频(如每秒)运行并调用sample()在本地采样，只在rollup_seconds到期时把窗口内的样本汇总成文档推送
+3、汇总文档的原字段保存平均值，另加{字段}_min、{字段}_max及samples(样本数)，汇总后峰值不会丢失
+4、每个容器最多保留SAMPLE_STORE_CAPACITY个样本，超出时丢弃最早的样本并计数
+5、样本只保存在内存中，需以python方式运行Job
+"""
+
+import os
+import copy
+import time
+from array import array
+
+SAMPLE_STORE_CAPACITY = int(os.environ.get("SAMPLE_STORE_CAPACITY", 3600))
+NAN = float("nan")
+
+
+class Series(object):
+    __slots__ = ("meta", "timestamps", "columns")
+
+    def __init__(self):
+        # 非指标字段(service_name、host_port等)只保留最新一份
+        self.meta = {}
+        self.timestamps = array('d')
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, values):
+        for field in values.keys():
+            if field not in self.columns:
+                # 新出现的指标，之前的样本补NaN
+                self.columns[field] = array('d', [NAN]) * len(self.timestamps)
+        self.timestamps.append(timestamp)
+        for field, column in self.columns.items():
+            column.append(values.get(field, NAN))
+
+    def trim(self, capacity):
+        dropped = len(self.timestamps) - capacity
+        if dropped > 0:
+            del self.timestamps[:dropped]
+            for column in self.columns.values():
+                del column[:dropped]
+        return max(dropped, 0)
+
+    def rollup(self):
+        doc = dict(self.meta)
+        doc.update({"@timestamp": self.timestamps[-1], "samples": len(self.timestamps)})
+        for field, column in self.columns.items():
+            values = [x for x in column if x == x]
+            if values:
+                doc[field] = round(sum(values) / len(values), 2)
+                doc[field + "_min"] = min(values)
+                doc[field + "_max"] = max(values)
+        return doc
+
+
+class SampleStore(object):
+
+    def __init__(self, capacity=SAMPLE_STORE_CAPACITY):
+        self._capacity = capacity
+        self._series = {}
+        self._window_start = {}
+        self._stats = {"samples": 0, "dropped": 0, "rollups": 0, "rollup_docs": 0}
+
+    def record(self, source, con_id, doc, fields):
+        key = (source, con_id)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = Series()
+        series.meta = {k: v for k, v in doc.items() if k not in fields}
+        series.append(doc.get("@timestamp", time.time() * 1000),
+                      {x: float(doc[x]) for x in fields if doc.get(x) is not None})
+        self._stats['samples'] += 1
+        self._stats['dropped'] += series.trim(self._capacity)
+
+    # 第一次调用时开始计时，窗口满rollup_seconds后到期
+    def due(self, source, rollup_seconds):
+        return time.time() - self._window_start.setdefault(source, time.time()) >= rollup_seconds
+
+    # 汇总并清空该前缀下所有容器的样本，已停止的容器不会残留
+    def rollup(self, source):
+        docs = {}
+        for key in [x for x in self._series.keys() if x[0] == source]:
+            series = self._series.pop(key)
+            if len(series):
+                docs[key[1]] = series.rollup()
+        self._window_start[source] = time.time()
+        self._stats['rollups'] += 1
+        self._stats['rollup_docs'] += len(docs)
+        return docs
+
+    # 记录本次采集的文档，窗口到期时返回汇总文档，否则返回None
+    def sample(self, source, docs, fields, rollup_seconds):
+        for con_id, doc in docs.items():
+            self.record(source, con_id, doc, fields)
+        if self.due(source, rollup_seconds):
+            return self.rollup(source)
+        return None
+
+    def stats(self):
+        result = dict(self._stats)
+        result['series'] = len(self._series)
+        result['buffered'] = sum(len(x) for x in self._series.values())
+        return result
+
+
+def rollup_mapping(mapping, fields):
+    mapping = copy.deepcopy(mapping)
+    properties = mapping['mappings']['doc']['properties']
+    for field in fields:
+        properties.setdefault(field + "_min", {"type": "float"})
+        properties.setdefault(field + "_max", {"type": "float"})
+    properties.setdefault("samples", {"type": "integer"})
+    return mapping
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = SampleStore()
+    return _store
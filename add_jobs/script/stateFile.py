@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""
+1、本地JSON状态文件的读写，dockerMeta、esIndex、changeFilter及getDockerInfo的CPU样本共用
+2、写入时先写临时文件再os.replace替换，进程中途退出或多个命令行进程同时写入时不会留下不完整的文件
+3、文件不存在或内容有误时返回默认值，写入失败时打印错误并返回False，不影响采集
+"""
+
+import os
+import json
+import time
+
+
+def load(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save(path, data):
+    try:
+        tmp_file = "{}.{}".format(path, os.getpid())
+        with open(tmp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, path)
+        return True
+    except OSError as e:
+        print("{} stateFile Func save() {} Error Message: {}".format(time.time(), path, e))
+        return False